@@ -71,6 +71,13 @@ class Error(namedtuple('Error', ['severity', 'message'])):
     def __eq__(self, other):
         return repr(self) == repr(other)
 
+    def __ne__(self, other):
+        return not self.__eq__(other)
+
+    def __hash__(self):
+        # consistent with __eq__ such that errors can be deduplicated in a set
+        return hash(repr(self))
+
     def _get_values(self):
         sev = severities[self.severity]
         msg = self._clean_string(repr(self.message))
@@ -18,22 +18,41 @@ from __future__ import absolute_import
 from __future__ import print_function
 from __future__ import unicode_literals
 
+import base64
 import json
+from multiprocessing.pool import ThreadPool
+import socket
+import threading
 
 from attributecode import ERROR
 from attributecode import Error
 from attributecode.util import python2
+from attributecode.util import unique
 
 
 if python2:  # pragma: nocover
+    from httplib import HTTPConnection  # NOQA
+    from httplib import HTTPException  # NOQA
+    from httplib import HTTPSConnection  # NOQA
+    from urllib import getproxies  # NOQA
+    from urllib import proxy_bypass  # NOQA
     from urllib import quote  # NOQA
+    from urllib import unquote  # NOQA
     from urllib import urlencode  # NOQA
     from urllib2 import HTTPError  # NOQA
     from urllib2 import Request  # NOQA
     from urllib2 import urlopen  # NOQA
+    from urlparse import urlparse  # NOQA
 else:  # pragma: nocover
+    from http.client import HTTPConnection  # NOQA
+    from http.client import HTTPException  # NOQA
+    from http.client import HTTPSConnection  # NOQA
     from urllib.parse import quote  # NOQA
+    from urllib.parse import unquote  # NOQA
     from urllib.parse import urlencode  # NOQA
+    from urllib.parse import urlparse  # NOQA
+    from urllib.request import getproxies  # NOQA
+    from urllib.request import proxy_bypass  # NOQA
     from urllib.request import Request  # NOQA
     from urllib.request import urlopen  # NOQA
     from urllib.error import HTTPError  # NOQA
@@ -44,20 +63,38 @@ API call helpers
 """
 
 
-# FIXME: args should start with license_key
-def request_license_data(api_url, api_key, license_key):
+AUTH_ERROR_MESSAGE = (
+    u"Authorization denied. Invalid '--api_key'. License generation is skipped.")
+
+INVALID_API_URL_MESSAGE = (
+    u"URL not reachable. Invalid '--api_url'. License generation is skipped.")
+
+NETWORK_ERROR_MESSAGE = (
+    u"Cannot connect to the license API at %(api_url)s: %(error)s. "
+    u"License generation is skipped.")
+
+SERVER_ERROR_MESSAGE = (
+    u"The license API at %(api_url)s failed with HTTP status %(status)s. "
+    u"Some licenses could not be fetched.")
+
+
+def get_license_request(api_url, api_key, license_key=None, license_keys=()):
     """
-    Return a tuple of (dictionary of license data, list of errors) given a
-    `license_key`. Send a request to `api_url` authenticating with `api_key`.
+    Return a tuple of (quoted URL, headers) to request the data of a
+    `license_key` or of a list of `license_keys` from `api_url`
+    authenticating with `api_key`.
     """
     headers = {
         'Authorization': 'Token %s' % api_key,
     }
     payload = {
         'api_key': api_key,
-        'key': license_key,
         'format': 'json'
     }
+    if license_keys:
+        payload['key__in'] = ','.join(license_keys)
+    else:
+        payload['key'] = license_key
 
     api_url = api_url.rstrip('/')
     payload = urlencode(payload)
@@ -65,42 +102,307 @@ def request_license_data(api_url, api_key, license_key):
     full_url = '%(api_url)s/?%(payload)s' % locals()
     # handle special characters in URL such as space etc.
     quoted_url = quote(full_url, safe="%/:=&?~#+!$,;'@()*[]")
+    return quoted_url, headers
 
+
+def get_license_data(response_content, license_key):
+    """
+    Return a tuple of (dictionary of license data, list of errors) given the
+    JSON `response_content` bytes of a `license_key` request.
+    """
+    license_data = json.loads(response_content.decode('utf-8'))
+    errors = []
+    if not license_data['results']:
+        msg = u"Invalid 'license': %s" % license_key
+        errors.append(Error(ERROR, msg))
+    if license_data.get('count') == 1:
+        license_data = license_data.get('results')[0]
+    else:
+        license_data = {}
+    return license_data, errors
+
+
+def get_http_error(status, license_key):
+    """
+    Return an Error for an HTTP error `status` code of a `license_key` request.
+    """
+    # some auth problem
+    if status == 403:
+        return Error(ERROR, AUTH_ERROR_MESSAGE)
+    # Since no api_url/api_key/network status have
+    # problem detected, it yields 'license' is the cause of
+    # this exception.
+    return Error(ERROR, u"Invalid 'license': %s" % license_key)
+
+
+# FIXME: args should start with license_key
+def request_license_data(api_url, api_key, license_key):
+    """
+    Return a tuple of (dictionary of license data, list of errors) given a
+    `license_key`. Send a request to `api_url` authenticating with `api_key`.
+    """
+    quoted_url, headers = get_license_request(api_url, api_key, license_key)
     license_data = {}
     errors = []
     try:
         request = Request(quoted_url, headers=headers)
         response = urlopen(request)
-        response_content = response.read().decode('utf-8')
-        # FIXME: this should be an ordered dict
-        license_data = json.loads(response_content)
-        if not license_data['results']:
-            msg = u"Invalid 'license': %s" % license_key
-            errors.append(Error(ERROR, msg))
+        license_data, errors = get_license_data(response.read(), license_key)
 
     except HTTPError as http_e:
-        # some auth problem
-        if http_e.code == 403:
-            msg = (u"Authorization denied. Invalid '--api_key'. "
-                   u"License generation is skipped.")
-            errors.append(Error(ERROR, msg))
-        else:
-            # Since no api_url/api_key/network status have
-            # problem detected, it yields 'license' is the cause of
-            # this exception.
-            msg = u"Invalid 'license': %s" % license_key
-            errors.append(Error(ERROR, msg))
+        errors.append(get_http_error(http_e.code, license_key))
 
     except Exception as e:
         errors.append(Error(ERROR, str(e)))
 
-    finally:
-        if license_data.get('count') == 1:
-            license_data = license_data.get('results')[0]
+    return license_data, errors
+
+
+class LicenseFetcher(object):
+    """
+    Fetch the data of many licenses from a DejaCode `api_url` authenticating
+    with `api_key`.
+
+    The licenses are requested in batches of up to `batch_size` license keys
+    per request. The batches are requested concurrently by up to `max_workers`
+    threads, each reusing its own persistent keep-alive HTTP connection. The
+    fetched license data and the invalid license keys are remembered such that
+    a license key is never requested twice.
+
+    There is no upfront connectivity check: the first request that fails to
+    connect within `timeout` seconds, is denied or does not reach a license
+    API reports the problem once and the remaining requests are skipped.
+
+    The requests go through the proxies configured in the environment with
+    the "http_proxy", "https_proxy" and "no_proxy" variables, as with urlopen.
+    """
+
+    def __init__(self, api_url, api_key, batch_size=50, max_workers=8, timeout=10):
+        self.api_url = api_url
+        self.api_key = api_key
+        self.batch_size = batch_size
+        self.max_workers = max_workers
+        self.timeout = timeout
+
+        # {license key: license data}
+        self.licenses = {}
+        self.invalid_keys = set()
+        self.requests_count = 0
+        # an Error that prevents any further request
+        self.failure = None
+
+        # {scheme: proxy URL}
+        self.proxies = getproxies()
+
+        self.local = threading.local()
+        self.lock = threading.Lock()
+        self.connections = []
+
+    def get_proxy(self, parsed):
+        """
+        Return the parsed URL of the proxy to use for a `parsed` URL or None.
+        """
+        proxy = self.proxies.get(parsed.scheme)
+        if not proxy or proxy_bypass(parsed.hostname or ''):
+            return None
+        if '://' not in proxy:
+            proxy = 'http://' + proxy
+        return urlparse(proxy)
+
+    @staticmethod
+    def get_proxy_headers(proxy):
+        """
+        Return a mapping of the headers to authenticate with a `proxy` parsed
+        URL.
+        """
+        if not proxy.username:
+            return {}
+        credentials = '%s:%s' % (unquote(proxy.username), unquote(proxy.password or ''))
+        credentials = base64.b64encode(credentials.encode('utf-8')).decode('ascii')
+        return {'Proxy-Authorization': 'Basic %s' % credentials}
+
+    def get_connection(self, parsed):
+        """
+        Return the HTTP connection of the current thread to the server of a
+        `parsed` URL, creating it if needed.
+        """
+        connections = getattr(self.local, 'connections', None)
+        if connections is None:
+            connections = self.local.connections = {}
+        key = parsed.scheme, parsed.netloc
+        connection = connections.get(key)
+        if connection is None:
+            connection = connections[key] = self.new_connection(parsed)
+            with self.lock:
+                self.connections.append(connection)
+        return connection
+
+    def new_connection(self, parsed):
+        """
+        Return a new HTTP connection to the server of a `parsed` URL, through
+        a proxy if needed.
+        """
+        if parsed.scheme == 'https':
+            connection_class = HTTPSConnection
         else:
-            license_data = {}
+            connection_class = HTTPConnection
+        proxy = self.get_proxy(parsed)
+        if not proxy:
+            return connection_class(parsed.netloc, timeout=self.timeout)
 
-    return license_data, errors
+        connection = connection_class(
+            proxy.hostname, proxy.port, timeout=self.timeout)
+        if parsed.scheme == 'https':
+            # tunnel the encrypted connection through the proxy
+            connection.set_tunnel(
+                parsed.hostname, parsed.port,
+                headers=self.get_proxy_headers(proxy))
+        return connection
+
+    def get_request(self, parsed, headers):
+        """
+        Return a tuple of (path, headers) to request a `parsed` URL with
+        `headers`.
+        """
+        path = parsed.path + '?' + parsed.query
+        if parsed.scheme == 'http':
+            proxy = self.get_proxy(parsed)
+            if proxy:
+                # a plain HTTP proxy is sent the full URL
+                path = parsed.geturl()
+                headers = dict(headers)
+                headers.update(self.get_proxy_headers(proxy))
+        return path, headers
+
+    def request_batch(self, license_keys):
+        """
+        Return a tuple of ({license key: license data}, list of errors, list of
+        invalid license keys) for a `license_keys` list of license keys
+        requested at once with a "key__in" filter on the persistent connections
+        of this thread, following the pages of the results even if they are on
+        another server.
+
+        Only the keys missing from a successful response are invalid: the keys
+        of a batch that failed with a server or unexpected error are neither
+        fetched nor invalid and may be requested again later.
+        """
+        quoted_url, headers = get_license_request(
+            self.api_url, self.api_key, license_keys=license_keys)
+        requested = set(license_keys)
+        licenses = {}
+        if self.failure:
+            return licenses, [], []
+        connection = None
+        try:
+            while quoted_url:
+                parsed = urlparse(quoted_url)
+                connection = self.get_connection(parsed)
+                path, request_headers = self.get_request(parsed, headers)
+                status, content = self.get(connection, path, request_headers)
+                if status == 403:
+                    return {}, [self.fail(AUTH_ERROR_MESSAGE)], []
+                if status == 404:
+                    return {}, [self.fail(INVALID_API_URL_MESSAGE)], []
+                if status != 200:
+                    # a transient or server error: the keys may be valid
+                    api_url = self.api_url
+                    return {}, [Error(ERROR, SERVER_ERROR_MESSAGE % locals())], []
+                try:
+                    data = json.loads(content.decode('utf-8'))
+                    results = data['results']
+                except (ValueError, KeyError, TypeError):
+                    # not a license API
+                    return {}, [self.fail(INVALID_API_URL_MESSAGE)], []
+                for license_data in results:
+                    license_key = license_data.get('key')
+                    if license_key in requested:
+                        licenses[license_key] = license_data
+                quoted_url = data.get('next')
+
+        except (HTTPException, socket.error) as e:
+            if connection is not None:
+                connection.close()
+            api_url = self.api_url
+            error = e
+            return {}, [self.fail(NETWORK_ERROR_MESSAGE % locals())], []
+
+        except Exception as e:
+            if connection is not None:
+                connection.close()
+            return {}, [Error(ERROR, str(e))], []
+
+        invalid_keys = [key for key in license_keys if key not in licenses]
+        errors = [Error(ERROR, u"Invalid 'license': %s" % license_key)
+                  for license_key in invalid_keys]
+        return licenses, errors, invalid_keys
+
+    def fail(self, message):
+        """
+        Record and return an Error with `message` that prevents any further
+        request.
+        """
+        self.failure = Error(ERROR, message)
+        return self.failure
+
+    def get(self, connection, path, headers):
+        """
+        Return a tuple of (status, content bytes) for a GET request of `path`
+        with `headers` on `connection`.
+        """
+        with self.lock:
+            self.requests_count += 1
+        # an already open connection was kept alive from a previous request
+        reused = connection.sock is not None
+        try:
+            connection.request('GET', path, headers=headers)
+            response = connection.getresponse()
+        except (HTTPException, socket.error):
+            if not reused:
+                raise
+            # the server may have closed an idle kept alive connection:
+            # retry once on a fresh connection
+            connection.close()
+            connection.request('GET', path, headers=headers)
+            response = connection.getresponse()
+        return response.status, response.read()
+
+    def fetch(self, license_keys):
+        """
+        Return a tuple of ({license key: license data}, list of errors) for a
+        `license_keys` list of license keys.
+        """
+        errors = []
+        to_fetch = [key for key in unique(license_keys)
+                    if key not in self.licenses and key not in self.invalid_keys]
+        batches = [to_fetch[i:i + self.batch_size]
+                   for i in range(0, len(to_fetch), self.batch_size)]
+
+        if batches:
+            pool = ThreadPool(min(self.max_workers, len(batches)))
+            try:
+                # imap returns the results in the order of the batches
+                results = pool.imap(self.request_batch, batches)
+                for licenses, errs, invalid_keys in results:
+                    errors.extend(errs)
+                    self.licenses.update(licenses)
+                    self.invalid_keys.update(invalid_keys)
+            finally:
+                pool.close()
+                pool.join()
+                # the pool threads and their connections are not reused
+                self.close()
+
+        licenses = dict((key, self.licenses[key])
+                        for key in license_keys if key in self.licenses)
+        return licenses, unique(errors)
+
+    def close(self):
+        """
+        Close all the HTTP connections.
+        """
+        for connection in self.connections:
+            connection.close()
+        self.connections = []
 
 
 # FIXME: args should start with license_key
@@ -32,7 +32,7 @@ from attributecode import Error
 from attributecode.licenses import COMMON_LICENSES
 from attributecode.model import detect_special_char, parse_license_expression
 from attributecode.util import add_unc
-from attributecode.attrib_util import multi_sort
+from attributecode.attrib_util import get_template
 
 
 DEFAULT_TEMPLATE_FILE = os.path.join(
@@ -48,8 +48,26 @@ def generate(abouts, template=None, variables=None):
     Return a tuple of (error, attribution text) where error is an Error object
     or None and attribution text is the generated text or None.
     """
+    error, template, context = get_template_and_context(abouts, template, variables)
+    if error:
+        return error, None
+
     rendered = None
-    error = None
+    try:
+        rendered = template.render(**context)
+    except Exception as e:
+        error = get_template_processing_error(e)
+    return error, rendered
+
+
+def get_template_and_context(abouts, template, variables=None):
+    """
+    Return a tuple of (error, compiled template, context) to render an
+    attribution from an `abouts` list of About objects, a `template` template
+    text and a `variables` optional dict of extra variables, where context is
+    a mapping of the template variables. On error, the template and context
+    are None.
+    """
     template_error = check_template(template)
     if template_error:
         lineno, message = template_error
@@ -57,125 +75,138 @@ def generate(abouts, template=None, variables=None):
             CRITICAL,
             'Template validation error at line: {lineno}: "{message}"'.format(**locals())
         )
-        return error, None
+        return error, None, None
 
-    template = jinja2.Template(template)
+    template = get_template(template)
 
     try:
-        captured_license = []
-        license_file_key_and_context = {}
-        sorted_license_file_key_and_context = {}
-        license_file_name_and_license_file_key = {}
-        license_key_and_license_name = {}
-        license_name_and_license_key = {}
-        license_key_and_license_file_name = {}
-        license_file_key_and_license_key = {}
-        # FIXME: This need to be simplified
+        license_index = LicenseIndex()
         for about in abouts:
-            # about.license_file.value is a OrderDict with license_file_name as
-            # the key and the license text as the value
-            if about.license_file:
-                # We want to create a dictionary which have the license file key as
-                # the key and license text as the value
-                # The reason we want to use license file key as the key instead of the
-                # license key is because there is a scenario such that the input only provide
-                # license_file but not license_key
-                # The license file key is bascially a license_key or a license file
-                # name if it's not generated from DJE. The reason for not using
-                # license file name as the key at the first place is because
-                # we need the license_key to match with the common license list
-                for license_file_name in about.license_file.value:
-                    if not license_file_name in captured_license:
-                        captured_license.append(license_file_name)
-                        license_file_key = get_license_file_key(license_file_name)
-                        license_file_key_and_context[license_file_key] = about.license_file.value[license_file_name]
-                        sorted_license_file_key_and_context = collections.OrderedDict(sorted(license_file_key_and_context.items()))
-                        license_file_name_and_license_file_key[license_file_name] = license_file_key
-
-            lic_list = []
-            lic_name_list = []
-            lic_name_expression_list = []
-            # Convert/map the key to name
-            if about.license_name.value:
-                if about.license_expression.value or about.license_key.value:
-                    if about.license_expression.value:
-                        special_char, lic_list = parse_license_expression(about.license_expression.value)
-                        about.license_key.value = lic_list
-                    else:
-                        lic_list = about.license_key.value
-                        special_char = []
-                        for lic in lic_list:
-                            special_char_list = detect_special_char(lic)
-                            if special_char_list:
-                                for char in special_char_list:
-                                    special_char.append(char)
-                    if special_char:
-                        error = Error(CRITICAL, 'Special character(s) are not allowed in '
-                                      'license_expression or license_key: %s' % special_char)
-                        return error, ''
-                else:
-                    # No license_key or license_expression present. We will put
-                    # None as the value of license key
-                    about.license_key.value = about.license_file.value.keys()
-                    lic_list = about.license_file.value.keys()
-
-                lic_name_list = about.license_name.value
-
-                # The order of the license_name and key should be the same
-                # The length for both list should be the same
-                assert len(lic_name_list) == len(lic_list)
-
-                # Map the license key to license name
-                index_for_license_name_list = 0
-                for key in lic_list:
-                    license_key_and_license_file_name[key] = list(about.license_file.value.keys())[index_for_license_name_list]
-                    license_key_and_license_name[key] = lic_name_list[index_for_license_name_list]
-                    license_name_and_license_key[lic_name_list[index_for_license_name_list]] = key
-                    license_file_key = license_file_name_and_license_file_key[license_key_and_license_file_name[key]]
-                    license_file_key_and_license_key[license_file_key] = key
-                    index_for_license_name_list = index_for_license_name_list + 1
-
-                # Create a license expression with license name instead of key
-                for segment in about.license_expression.value.split():
-                    if segment in license_key_and_license_name:
-                        lic_name_expression_list.append(license_key_and_license_name[segment])
-                    else:
-                        lic_name_expression_list.append(segment)
-    
-                # Join the license name expression into a single string
-                lic_name_expression = ' '.join(lic_name_expression_list)
-    
-                # Add the license name expression string into the about object
-                about.license_name_expression = lic_name_expression
+            error = license_index.add(about)
+            if error:
+                return error, None, None
 
         # Get the current UTC time
         utcnow = datetime.datetime.utcnow()
-        rendered = template.render(
+        context = dict(
             abouts=abouts, common_licenses=COMMON_LICENSES,
-            license_file_key_and_context=sorted_license_file_key_and_context,
-            license_file_key_and_license_key=license_file_key_and_license_key,
-            license_file_name_and_license_file_key=license_file_name_and_license_file_key,
-            license_key_and_license_file_name=license_key_and_license_file_name,
-            license_key_and_license_name=license_key_and_license_name,
-            license_name_and_license_key=license_name_and_license_key,
             utcnow=utcnow,
             tkversion=__version__,
             variables=variables
         )
+        context.update(license_index.get_mappings())
     except Exception as e:
-        lineno = getattr(e, 'lineno', '') or ''
-        if lineno:
-            lineno = ' at line: {}'.format(lineno)
-        err = getattr(e, 'message', '') or ''
-#        error = Error(
-#            CRITICAL,
-#            'Template processing error {lineno}: {err}'.format(**locals()),
-#        )
-        error = Error(
-            CRITICAL,
-            'Template processing error:' + str(e),
+        return get_template_processing_error(e), None, None
+    return None, template, context
+
+
+class LicenseIndex(object):
+    """
+    An index of the licenses of a list of About objects, built in a single
+    pass with add() and exposing the license mappings used by the templates.
+    """
+
+    def __init__(self):
+        # The license file key is bascially a license_key or a license file
+        # name if it's not generated from DJE. The reason for not using
+        # license file name as the key is because we need the license_key to
+        # match with the common license list
+        self.license_file_key_and_context = {}
+        self.license_file_name_and_license_file_key = {}
+        self.license_key_and_license_name = {}
+        self.license_name_and_license_key = {}
+        self.license_key_and_license_file_name = {}
+        self.license_file_key_and_license_key = {}
+
+    def add(self, about):
+        """
+        Index the licenses of an `about` About object and set its
+        license_name_expression. Return an Error or None.
+        """
+        # about.license_file.value is a OrderDict with license_file_name as
+        # the key and the license text as the value
+        if about.license_file:
+            # The license file key is used as the key instead of the license
+            # key because the input may only provide license_file but not
+            # license_key
+            for license_file_name, context in about.license_file.value.items():
+                if license_file_name not in self.license_file_name_and_license_file_key:
+                    license_file_key = get_license_file_key(license_file_name)
+                    self.license_file_key_and_context[license_file_key] = context
+                    self.license_file_name_and_license_file_key[license_file_name] = license_file_key
+
+        # Convert/map the key to name
+        if not about.license_name.value:
+            return
+
+        if about.license_expression.value or about.license_key.value:
+            if about.license_expression.value:
+                special_char, lic_list = parse_license_expression(about.license_expression.value)
+                about.license_key.value = lic_list
+            else:
+                lic_list = about.license_key.value
+                special_char = []
+                for lic in lic_list:
+                    special_char.extend(detect_special_char(lic))
+            if special_char:
+                return Error(CRITICAL, 'Special character(s) are not allowed in '
+                             'license_expression or license_key: %s' % special_char)
+        else:
+            # No license_key or license_expression present. We will put
+            # None as the value of license key
+            about.license_key.value = about.license_file.value.keys()
+            lic_list = about.license_file.value.keys()
+
+        lic_name_list = about.license_name.value
+
+        # The order of the license_name and key should be the same
+        # The length for both list should be the same
+        assert len(lic_name_list) == len(lic_list)
+
+        # Map the license key to license name
+        license_file_names = list(about.license_file.value.keys())
+        for index, key in enumerate(lic_list):
+            license_file_name = license_file_names[index]
+            license_name = lic_name_list[index]
+            self.license_key_and_license_file_name[key] = license_file_name
+            self.license_key_and_license_name[key] = license_name
+            self.license_name_and_license_key[license_name] = key
+            license_file_key = self.license_file_name_and_license_file_key[license_file_name]
+            self.license_file_key_and_license_key[license_file_key] = key
+
+        # Create a license expression with license name instead of key
+        lic_name_expression_list = []
+        for segment in about.license_expression.value.split():
+            lic_name_expression_list.append(
+                self.license_key_and_license_name.get(segment, segment))
+
+        # Add the license name expression string into the about object
+        about.license_name_expression = ' '.join(lic_name_expression_list)
+
+    def get_mappings(self):
+        """
+        Return a mapping of the template variable names to the license
+        mappings of this index.
+        """
+        return dict(
+            license_file_key_and_context=collections.OrderedDict(
+                sorted(self.license_file_key_and_context.items())),
+            license_file_key_and_license_key=self.license_file_key_and_license_key,
+            license_file_name_and_license_file_key=self.license_file_name_and_license_file_key,
+            license_key_and_license_file_name=self.license_key_and_license_file_name,
+            license_key_and_license_name=self.license_key_and_license_name,
+            license_name_and_license_key=self.license_name_and_license_key,
         )
-    return error, rendered
+
+
+def get_template_processing_error(e):
+    """
+    Return an Error for an `e` exception raised while processing a template.
+    """
+    return Error(
+        CRITICAL,
+        'Template processing error:' + str(e),
+    )
 
 
 def get_license_file_key(license_text_name):
@@ -192,8 +223,7 @@ def check_template(template_string):
     message) if the template is invalid or None if it is valid.
     """
     try:
-        jinja2.filters.FILTERS['multi_sort'] = multi_sort
-        jinja2.Template(template_string)
+        get_template(template_string)
     except (jinja2.TemplateSyntaxError, jinja2.TemplateAssertionError) as e:
         return e.lineno, e.message
 
@@ -207,11 +237,16 @@ def generate_from_file(abouts, template_loc=DEFAULT_TEMPLATE_FILE, variables=Non
     Return a tuple of (error, attribution text) where error is an Error object
     or None and attribution text is the generated text or None.
     """
+    return generate(abouts, template=read_template(template_loc), variables=variables)
+
 
-    template_loc = add_unc(template_loc)
+def read_template(template_loc=DEFAULT_TEMPLATE_FILE):
+    """
+    Return the text of the template file at `template_loc`.
+    """
+    template_loc = add_unc(template_loc or DEFAULT_TEMPLATE_FILE)
     with io.open(template_loc, encoding='utf-8') as tplf:
-        tpls = tplf.read()
-    return generate(abouts, template=tpls, variables=variables)
+        return tplf.read()
 
 
 def generate_and_save(abouts, output_location, template_loc=None, variables=None):
@@ -220,7 +255,10 @@ def generate_and_save(abouts, output_location, template_loc=None, variables=None
     `template_loc` template file location and a `variables` optional
     dict of extra variables. Save the generated attribution text in the
     `output_location` file.
-    Return a list of Error objects if any.
+
+    The attribution is rendered and written in chunks, without building the
+    whole text in memory. Return a tuple of (list of Error objects if any,
+    output_location or None if no attribution was saved).
     """
     errors = []
 
@@ -234,18 +272,25 @@ def generate_and_save(abouts, output_location, template_loc=None, variables=None
                    str(special_char_in_expression))
             errors.append(Error(ERROR, msg))
 
-    rendering_error, rendered = generate_from_file(
+    rendering_error, template, context = get_template_and_context(
         abouts,
-        template_loc=template_loc,
+        template=read_template(template_loc),
         variables=variables
     )
 
     if rendering_error:
         errors.append(rendering_error)
+        return errors, None
 
-    if rendered:
-        output_location = add_unc(output_location)
+    output_location = add_unc(output_location)
+    try:
         with io.open(output_location, 'w', encoding='utf-8') as of:
-            of.write(rendered)
+            template.stream(**context).dump(of)
+    except Exception as e:
+        errors.append(get_template_processing_error(e))
+        # do not leave a partial attribution behind
+        if os.path.exists(output_location):
+            os.remove(output_location)
+        return errors, None
 
-    return errors, rendered
+    return errors, output_location
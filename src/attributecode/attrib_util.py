@@ -18,29 +18,119 @@ from __future__ import absolute_import
 from __future__ import print_function
 from __future__ import unicode_literals
 
+from collections import OrderedDict
+import hashlib
+import os
+
+from jinja2 import BaseLoader
 from jinja2 import Environment
+from jinja2 import FileSystemBytecodeCache
+from jinja2 import TemplateNotFound
 from jinja2.filters import environmentfilter
 from jinja2.filters import make_attrgetter
 from jinja2.filters import ignore_case
 from jinja2.filters import FilterArgumentError
 
+from attributecode.cache import get_default_cache_dir
+
 
 """
 Extra JINJA2 custom filters and other template utilities.
 """
 
 
+class TextLoader(BaseLoader):
+    """
+    Load template texts registered by name. Loading templates through a loader
+    rather than from strings lets the environment cache the compiled templates
+    in memory and in its bytecode cache.
+
+    Only the `max_size` most recently registered texts are kept: a text is
+    only needed until its template is compiled and is registered again before
+    it is compiled again.
+    """
+
+    def __init__(self, max_size=50):
+        self.max_size = max_size
+        # {name: text} in least recently registered first order
+        self.texts = OrderedDict()
+
+    def add(self, name, text):
+        """
+        Register a template `text` with a `name`.
+        """
+        self.texts.pop(name, None)
+        self.texts[name] = text
+        while len(self.texts) > self.max_size:
+            self.texts.popitem(last=False)
+
+    def get_source(self, environment, template):
+        text = self.texts.get(template)
+        if text is None:
+            raise TemplateNotFound(template)
+        return text, None, lambda: True
+
+
+_environment = None
+
+# the environment variable with the location of the bytecode cache directory
+# of the compiled templates. The cache is disabled if it is empty.
+TEMPLATE_CACHE_ENV = 'ABOUTCODE_TEMPLATE_CACHE'
+
+
+def get_bytecode_cache(location=None):
+    """
+    Return a bytecode cache for the compiled templates stored in the
+    `location` directory or None if this directory cannot be created.
+
+    The location defaults to the ABOUTCODE_TEMPLATE_CACHE environment variable
+    if set, or else to the "templates" directory of the user cache directory.
+    Return None if the location is empty.
+    """
+    if location is None:
+        location = os.environ.get(TEMPLATE_CACHE_ENV)
+    if location is None:
+        location = os.path.join(get_default_cache_dir(), 'templates')
+    if not location:
+        return None
+    try:
+        if not os.path.exists(location):
+            os.makedirs(location)
+    except OSError:
+        return None
+    return FileSystemBytecodeCache(location)
+
+
+def get_environment():
+    """
+    Return the shared Environment used to compile all the templates, with our
+    custom filters registered.
+    """
+    global _environment
+    if _environment is None:
+        env = Environment(
+            loader=TextLoader(),
+            bytecode_cache=get_bytecode_cache(),
+            autoescape=False)
+        # register our custom filters
+        env.filters.update(dict(
+            unique_together=unique_together,
+            multi_sort=multi_sort))
+        _environment = env
+    return _environment
+
+
 def get_template(template_text):
     """
     Return a template built from a text string.
-    Register custom templates as needed.
+    The template is compiled only once and reused for the same text.
     """
-    env = Environment(autoescape=True)
-    # register our custom filters
-    env.filters.update(dict(
-        unique_together=unique_together,
-        multi_sort=multi_sort))
-    return env.from_string(template_text)
+    env = get_environment()
+    # the text checksum is the template name such that the same text is
+    # always cached under the same name
+    name = hashlib.sha1(template_text.encode('utf-8')).hexdigest()
+    env.loader.add(name, template_text)
+    return env.get_template(name)
 
 
 @environmentfilter
@@ -0,0 +1,299 @@
+#!/usr/bin/env python
+# -*- coding: utf8 -*-
+
+# ============================================================================
+#  Copyright (c) 2020 nexB Inc. http://www.nexb.com/ - All rights reserved.
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#      http://www.apache.org/licenses/LICENSE-2.0
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+# ============================================================================
+
+"""
+Persistent on-disk caches used to avoid redoing expensive work across runs.
+"""
+
+from __future__ import absolute_import
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import hashlib
+import io
+import json
+import os
+import pickle
+import posixpath
+import sqlite3
+import time
+
+from attributecode import __version__
+from attributecode.util import add_unc
+from attributecode.util import python2
+from attributecode.util import to_posix
+
+if python2:  # pragma: nocover
+    from urllib import quote  # NOQA
+    from urlparse import urlparse  # NOQA
+else:  # pragma: nocover
+    from urllib.parse import quote  # NOQA
+    from urllib.parse import urlparse  # NOQA
+
+
+if python2:  # pragma: nocover
+
+    def replace_file(source, target):
+        """
+        Move the `source` file to `target`, replacing any existing `target`
+        file.
+        """
+        try:
+            os.rename(source, target)
+        except OSError:
+            # on Windows an existing file cannot be replaced by a rename
+            os.remove(target)
+            os.rename(source, target)
+else:  # pragma: nocover
+    replace_file = os.replace
+
+
+# the names of the fields whose paths point to files that are loaded or
+# checked for existence when an ABOUT file is validated
+PATH_FIELD_NAMES = (
+    'about_resource',
+    'license_file',
+    'notice_file',
+    'changelog_file',
+    'author_file',
+)
+
+
+def get_file_signature(location):
+    """
+    Return a (mtime, size) tuple for the file at `location` or None if the file
+    does not exist.
+    """
+    try:
+        stat = os.stat(add_unc(location))
+    except OSError:
+        return None
+    return stat.st_mtime, stat.st_size
+
+
+def get_sha1(location):
+    """
+    Return the SHA1 hex digest of the content of the file at `location`.
+    """
+    sha1 = hashlib.sha1()
+    with open(add_unc(location), 'rb') as inp:
+        for chunk in iter(lambda: inp.read(1024 * 1024), b''):
+            sha1.update(chunk)
+    return sha1.hexdigest()
+
+
+def get_dependencies(about, location):
+    """
+    Return a list of (location, signature) tuples for each file referenced by
+    the path fields of an `about` About object loaded from `location`.
+    """
+    base_dir = posixpath.dirname(to_posix(location))
+    dependencies = []
+    for name in PATH_FIELD_NAMES:
+        field = getattr(about, name)
+        if not field.present or not isinstance(field.value, dict):
+            continue
+        for path in field.value:
+            dependency = os.path.abspath(os.path.normpath(posixpath.join(base_dir, path)))
+            dependencies.append((dependency, get_file_signature(dependency)))
+    return dependencies
+
+
+class InventoryCache(object):
+    """
+    A persistent cache of loaded and validated About objects stored in an
+    SQLite database at `location`.
+
+    Each entry is keyed by the ABOUT file location and its relative
+    about_file_path. An entry is reused only if the ABOUT file is unchanged
+    (same mtime and size, or else same content SHA1) and if none of the files
+    referenced in its about_resource, license_file, notice_file,
+    changelog_file and author_file fields has changed since it was cached.
+    """
+
+    def __init__(self, location):
+        self.location = location
+        self.connection = sqlite3.connect(add_unc(location))
+        self.hits = 0
+        self.misses = 0
+        self._create_tables()
+
+    def _create_tables(self):
+        cursor = self.connection.cursor()
+        cursor.execute(
+            'CREATE TABLE IF NOT EXISTS metadata '
+            '(name TEXT PRIMARY KEY, value TEXT)')
+        cursor.execute(
+            'CREATE TABLE IF NOT EXISTS abouts ('
+            'location TEXT, '
+            'about_file_path TEXT, '
+            'mtime REAL, '
+            'size INTEGER, '
+            'sha1 TEXT, '
+            'dependencies BLOB, '
+            'about BLOB, '
+            'PRIMARY KEY (location, about_file_path))')
+
+        # the validation rules may change from a version to another: discard
+        # any entry created with another version
+        cursor.execute("SELECT value FROM metadata WHERE name = 'version'")
+        row = cursor.fetchone()
+        if not row or row[0] != __version__:
+            cursor.execute('DELETE FROM abouts')
+            cursor.execute(
+                "INSERT OR REPLACE INTO metadata VALUES ('version', ?)",
+                (__version__,))
+        self.connection.commit()
+
+    def get(self, location, about_file_path):
+        """
+        Return a cached About object for the ABOUT file at `location` with an
+        `about_file_path` or None if there is no valid cached entry.
+        """
+        cursor = self.connection.execute(
+            'SELECT mtime, size, sha1, dependencies, about FROM abouts '
+            'WHERE location = ? AND about_file_path = ?',
+            (location, about_file_path))
+        row = cursor.fetchone()
+        about = None
+        if row:
+            mtime, size, sha1, dependencies, pickled = row
+            signature = get_file_signature(location)
+            unchanged = signature == (mtime, size)
+            if not unchanged and signature:
+                # the file may have been touched but not modified
+                unchanged = get_sha1(location) == sha1
+                if unchanged:
+                    self.connection.execute(
+                        'UPDATE abouts SET mtime = ?, size = ? '
+                        'WHERE location = ? AND about_file_path = ?',
+                        signature + (location, about_file_path))
+            if unchanged and all(get_file_signature(dependency) == dependency_signature
+                                 for dependency, dependency_signature
+                                 in pickle.loads(dependencies)):
+                about = pickle.loads(pickled)
+
+        if about is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return about
+
+    def put(self, location, about_file_path, about):
+        """
+        Cache an `about` About object loaded from the ABOUT file at `location`
+        with an `about_file_path`.
+        """
+        signature = get_file_signature(location)
+        if not signature:
+            return
+        mtime, size = signature
+        dependencies = get_dependencies(about, location)
+        self.connection.execute(
+            'INSERT OR REPLACE INTO abouts VALUES (?, ?, ?, ?, ?, ?, ?)',
+            (location, about_file_path, mtime, size, get_sha1(location),
+             sqlite3.Binary(pickle.dumps(dependencies, pickle.HIGHEST_PROTOCOL)),
+             sqlite3.Binary(pickle.dumps(about, pickle.HIGHEST_PROTOCOL))))
+
+    def close(self):
+        """
+        Save and close this cache.
+        """
+        self.connection.commit()
+        self.connection.close()
+
+
+# fetched license data are considered fresh for a week
+DEFAULT_LICENSE_MAX_AGE = 7 * 24 * 60 * 60
+
+
+def get_default_cache_dir():
+    """
+    Return the default location of the cache directory, honoring the
+    XDG_CACHE_HOME environment variable.
+    """
+    cache_home = os.environ.get('XDG_CACHE_HOME') or os.path.join(
+        os.path.expanduser('~'), '.cache')
+    return os.path.join(cache_home, 'aboutcode')
+
+
+class LicenseCache(object):
+    """
+    A persistent cache of license data fetched from a license library API
+    stored in a directory at `location`.
+
+    Each license is stored in its own JSON file with the license `key`,
+    `name` and `full_text` and an expiry timestamp. The licenses of each API
+    server are stored in a separate sub-directory. Entries older than
+    `max_age` seconds are stale: they are only used when working offline.
+    """
+
+    def __init__(self, location=None, max_age=DEFAULT_LICENSE_MAX_AGE):
+        self.location = location or get_default_cache_dir()
+        self.max_age = max_age
+
+    def get_license_location(self, api_url, license_key):
+        """
+        Return the location of the cache file of a `license_key` fetched from
+        `api_url`.
+        """
+        server = urlparse(api_url).netloc or 'default'
+        return os.path.join(
+            self.location, 'licenses', quote(server, safe=''),
+            quote(license_key, safe='') + '.json')
+
+    def get(self, api_url, license_key, allow_stale=False):
+        """
+        Return a license data mapping for a `license_key` fetched from
+        `api_url` or None if it is not cached or is stale and `allow_stale` is
+        False.
+        """
+        location = self.get_license_location(api_url, license_key)
+        try:
+            with io.open(add_unc(location), encoding='utf-8') as inp:
+                cached = json.load(inp)
+        except (IOError, OSError, ValueError):
+            return None
+        if not allow_stale and cached.get('expires', 0) < time.time():
+            return None
+        return cached.get('license')
+
+    def put(self, api_url, license_key, license_data):
+        """
+        Cache a `license_data` mapping for a `license_key` fetched from
+        `api_url`.
+        """
+        location = self.get_license_location(api_url, license_key)
+        parent = os.path.dirname(location)
+        if not os.path.exists(parent):
+            os.makedirs(parent)
+        cached = dict(
+            license=dict(
+                key=license_data.get('key', ''),
+                name=license_data.get('name', ''),
+                full_text=license_data.get('full_text', ''),
+            ),
+            expires=time.time() + self.max_age,
+        )
+        # write to a temporary file first such that concurrent runs never
+        # read a partially written entry
+        temp_location = location + '.%d.tmp' % os.getpid()
+        mode = 'w'
+        if python2:
+            mode = 'wb'
+        with io.open(add_unc(temp_location), mode) as out:
+            out.write(json.dumps(cached))
+        replace_file(temp_location, location)
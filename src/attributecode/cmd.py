@@ -38,13 +38,16 @@ from attributecode import severities
 from attributecode.attrib import check_template
 from attributecode.attrib import DEFAULT_TEMPLATE_FILE
 from attributecode.attrib import generate_and_save as generate_attribution_doc
-from attributecode.gen import generate as generate_about_files, load_inventory
+from attributecode.cache import InventoryCache
+from attributecode.cache import LicenseCache
+from attributecode.gen import iter_generate as iter_generate_about_files, load_inventory
 from attributecode.model import collect_inventory, get_copy_list
 from attributecode.model import copy_redist_src
 from attributecode.model import write_output
-from attributecode.util import extract_zip
+from attributecode.util import FileCopier
+from attributecode.util import ZipCopier
+from attributecode.util import ZipIndex
 from attributecode.util import filter_errors
-from attributecode.util import get_temp_dir
 
 
 __copyright__ = """
@@ -159,6 +162,26 @@ def validate_extensions(ctx, param, value, extensions=tuple(('.csv', '.json',)))
     type=click.Choice(['json', 'csv']),
     help='Set OUTPUT inventory file format.')
 
+@click.option('--ignore',
+    multiple=True,
+    metavar='PATTERN',
+    help='Ignore files and directories matching this glob PATTERN. '
+         'Ignored directories are not walked. Can be repeated.')
+
+@click.option('--processes',
+    type=click.IntRange(min=1),
+    metavar='N',
+    default=1,
+    show_default=True,
+    help='Use up to N processes to load and validate ABOUT files in parallel.')
+
+@click.option('--cache',
+    metavar='FILE',
+    type=click.Path(exists=False, dir_okay=False, writable=True, resolve_path=True),
+    help='Path to an inventory cache file. ABOUT files that did not change '
+         'since a previous run using the same cache file are not loaded and '
+         'validated again.')
+
 @click.option('-q', '--quiet',
     is_flag=True,
     help='Do not print error or warning messages.')
@@ -169,7 +192,7 @@ def validate_extensions(ctx, param, value, extensions=tuple(('.csv', '.json',)))
 
 @click.help_option('-h', '--help')
 
-def inventory(location, output, format, quiet, verbose):  # NOQA
+def inventory(location, output, format, ignore, processes, cache, quiet, verbose):  # NOQA
     """
 Collect the inventory of ABOUT file data as CSV or JSON.
 
@@ -181,13 +204,24 @@ OUTPUT: Path to the JSON or CSV inventory file to create.
         print_version()
         click.echo('Collecting inventory from ABOUT files...')
 
+    path_index = None
     if location.lower().endswith('.zip'):
-        # accept zipped ABOUT files as input
-        location = extract_zip(location)
-    errors, abouts = collect_inventory(location)
+        # accept zipped ABOUT files as input: read them from the archive
+        path_index = ZipIndex(location)
+        location = path_index.root
+    if cache:
+        cache = InventoryCache(cache)
+    try:
+        errors, abouts = collect_inventory(
+            location, processes=processes, cache=cache, ignores=ignore,
+            path_index=path_index)
+    finally:
+        if cache:
+            cache.close()
+        if path_index:
+            path_index.close()
     write_errors = write_output(abouts=abouts, location=output, format=format)
     errors.extend(write_errors)
-    errors = unique(errors)
     errors_count = report_errors(errors, quiet, verbose, log_file_loc=output + '-error.log')
     if not quiet:
         msg = 'Inventory collected in {output}.'.format(**locals())
@@ -226,11 +260,37 @@ OUTPUT: Path to the JSON or CSV inventory file to create.
     help='Fetch license data and text files from a DejaCode License Library '
          'API URL using the API KEY.')
 
+@click.option('--license-cache',
+    metavar='DIR',
+    type=click.Path(exists=False, file_okay=False, writable=True, resolve_path=True),
+    help='Path to a directory where the fetched license data are cached and '
+         'reused across runs. [default: ~/.cache/aboutcode]')
+
+@click.option('--offline',
+    is_flag=True,
+    help='With --fetch-license, use only the license data available in the '
+         'license cache and do not access the network.')
+
+@click.option('--fetch-timeout',
+    metavar='SECONDS',
+    type=float,
+    default=10,
+    show_default=True,
+    help='With --fetch-license, give up fetching licenses if the license API '
+         'does not respond within this number of seconds.')
+
 @click.option('--reference',
     metavar='DIR',
     type=click.Path(exists=True, file_okay=False, readable=True, resolve_path=True),
     help='Path to a directory with reference license data and text files.')
 
+@click.option('--workers',
+    type=click.IntRange(min=1),
+    metavar='N',
+    default=1,
+    show_default=True,
+    help='Use up to N threads to write ABOUT and license files in parallel.')
+
 @click.option('-q', '--quiet',
     is_flag=True,
     help='Do not print error or warning messages.')
@@ -241,7 +301,8 @@ OUTPUT: Path to the JSON or CSV inventory file to create.
 
 @click.help_option('-h', '--help')
 
-def gen(location, output, android, fetch_license, reference, quiet, verbose):
+def gen(location, output, android, fetch_license, license_cache, offline, fetch_timeout,
+        reference, workers, quiet, verbose):
     """
 Given a CSV/JSON inventory, generate ABOUT files in the output location.
 
@@ -257,18 +318,30 @@ OUTPUT: Path to a directory where ABOUT files are generated.
     if not location.endswith(('.csv', '.json',)):
         raise click.UsageError('ERROR: Invalid input file extension: must be one .csv or .json.')
 
-    errors, abouts = generate_about_files(
+    if offline and not fetch_license:
+        raise click.UsageError('ERROR: The --offline option requires the --fetch-license option.')
+
+    # the ABOUT files are generated while the inventory is read: only count
+    # them rather than keeping them all in memory
+    errors = []
+    abouts_count = 0
+    for about_errors, about in iter_generate_about_files(
         location=location,
         base_dir=output,
         android=android,
         reference_dir=reference,
         fetch_license=fetch_license,
-    )
+        license_cache=LicenseCache(license_cache),
+        offline=offline,
+        fetch_timeout=fetch_timeout,
+        workers=workers,
+    ):
+        errors.extend(about_errors)
+        if about is not None:
+            abouts_count += 1
 
-    errors = unique(errors)
     errors_count = report_errors(errors, quiet, verbose, log_file_loc=output + '-error.log')
     if not quiet:
-        abouts_count = len(abouts)
         msg = '{abouts_count} .ABOUT files generated in {output}.'.format(**locals())
         click.echo(msg)
     sys.exit(errors_count)
@@ -320,6 +393,19 @@ def validate_template(ctx, param, value):
     metavar='<key>=<value>',
     help='Add variable text as key=value for use in a custom attribution template.')
 
+@click.option('--ignore',
+    multiple=True,
+    metavar='PATTERN',
+    help='Ignore files and directories matching this glob PATTERN. '
+         'Ignored directories are not walked. Can be repeated.')
+
+@click.option('--processes',
+    type=click.IntRange(min=1),
+    metavar='N',
+    default=1,
+    show_default=True,
+    help='Use up to N processes to load and validate ABOUT files in parallel.')
+
 @click.option('-q', '--quiet',
     is_flag=True,
     help='Do not print error or warning messages.')
@@ -330,7 +416,7 @@ def validate_template(ctx, param, value):
 
 @click.help_option('-h', '--help')
 
-def attrib(location, output, template, vartext, quiet, verbose):
+def attrib(location, output, template, vartext, ignore, processes, quiet, verbose):
     """
 Generate an attribution document at OUTPUT using .ABOUT files at LOCATION.
 
@@ -342,11 +428,18 @@ OUTPUT: Path where to write the attribution document.
         print_version()
         click.echo('Generating attribution...')
 
-    # accept zipped ABOUT files as input
+    # accept zipped ABOUT files as input: read them from the archive
+    path_index = None
     if location.lower().endswith('.zip'):
-        location = extract_zip(location)
+        path_index = ZipIndex(location)
+        location = path_index.root
 
-    errors, abouts = collect_inventory(location)
+    try:
+        errors, abouts = collect_inventory(
+            location, processes=processes, ignores=ignore, path_index=path_index)
+    finally:
+        if path_index:
+            path_index.close()
 
     if not abouts:
         msg = 'No ABOUT file is found. Attribution generation halted.'
@@ -359,7 +452,6 @@ OUTPUT: Path where to write the attribution document.
         variables=vartext,
     )
     errors.extend(attrib_errors)
-    errors = unique(errors)
     errors_count = report_errors(errors, quiet, verbose, log_file_loc=output + '-error.log')
 
     if not quiet:
@@ -403,6 +495,40 @@ OUTPUT: Path where to write the attribution document.
     is_flag=True,
     help='Zip the copied sources to the output location.')
 
+@click.option('--compression-level',
+    type=click.IntRange(min=0, max=9),
+    metavar='N',
+    default=6,
+    show_default=True,
+    help='Compress the zipped sources at this level from 0 (no compression) '
+         'to 9 (best compression).')
+
+@click.option('--ignore',
+    multiple=True,
+    metavar='PATTERN',
+    help='Ignore files and directories matching this glob PATTERN. '
+         'Ignored directories are not walked. Can be repeated.')
+
+@click.option('--processes',
+    type=click.IntRange(min=1),
+    metavar='N',
+    default=1,
+    show_default=True,
+    help='Use up to N processes to load and validate ABOUT files in parallel.')
+
+@click.option('--workers',
+    type=click.IntRange(min=1),
+    metavar='N',
+    default=1,
+    show_default=True,
+    help='Use up to N threads to copy files in parallel. Not supported with --zip.')
+
+@click.option('--hardlink',
+    is_flag=True,
+    help='Hard link rather than copy the files when the output is on the same '
+         'filesystem. The linked files share their content with the sources. '
+         'Not supported with --zip.')
+
 @click.option('-q', '--quiet',
     is_flag=True,
     help='Do not print error or warning messages.')
@@ -413,7 +539,7 @@ OUTPUT: Path where to write the attribution document.
 
 @click.help_option('-h', '--help')
 
-def collect_redist_src(location, output, from_inventory, with_structures, zip, quiet, verbose):
+def collect_redist_src(location, output, from_inventory, with_structures, zip, compression_level, ignore, processes, workers, hardlink, quiet, verbose):
     """
 Collect sources that have 'redistribute' flagged as 'True' in .ABOUT files or inventory
 to the output location.
@@ -427,35 +553,49 @@ OUTPUT: Path to a directory or a zip file where sources will be copied to.
         if not output.endswith('.zip'):
             click.echo('The output needs to be a zip file.')
             sys.exit()
+        # the zipped sources are written sequentially in a single archive
+        if workers > 1 or hardlink:
+            raise click.UsageError(
+                'ERROR: The --workers and --hardlink options cannot be used with the --zip option.')
 
     if not quiet:
         print_version()
         click.echo('Collecting inventory from ABOUT files...')
 
+    path_index = None
     if location.lower().endswith('.zip'):
-        # accept zipped ABOUT files as input
-        location = extract_zip(location)
-
-    if from_inventory:
-        errors, abouts = load_inventory(from_inventory, location)
-    else:
-        errors, abouts = collect_inventory(location)
-
-    if zip:
-        # Copy to a temp location and the zip to the output location
-        output_location = get_temp_dir()
-    else:
-        output_location = output
-
-    copy_list, copy_list_errors = get_copy_list(abouts, location)
-    copy_errors = copy_redist_src(copy_list, location, output_location, with_structures)
-
-    if zip:
-        import shutil
-        # Stripped the .zip extension as the `shutil.make_archive` will
-        # append the .zip extension
-        output_no_extension = output.rsplit('.', 1)[0]
-        shutil.make_archive(output_no_extension, 'zip', output_location)
+        # accept zipped ABOUT files as input: read them from the archive and
+        # extract only the files to copy
+        path_index = ZipIndex(location)
+        location = path_index.root
+
+    try:
+        if from_inventory:
+            errors, abouts = load_inventory(from_inventory, location, path_index=path_index)
+        else:
+            errors, abouts = collect_inventory(
+                location, processes=processes, ignores=ignore, path_index=path_index)
+
+        copy_list, copy_list_errors = get_copy_list(abouts, location, path_index=path_index)
+        if zip:
+            # Copy directly in the zip: the paths are relative to the archive root
+            output_location = ''
+            copier = ZipCopier(
+                output, compression_level=compression_level, source=path_index)
+        else:
+            output_location = output
+            copier = FileCopier(workers=workers, link=hardlink, source=path_index)
+        try:
+            copy_errors = copy_redist_src(
+                copy_list, location, output_location, with_structures, copier=copier)
+        finally:
+            if zip:
+                copier.close()
+    finally:
+        if path_index:
+            path_index.close()
+    if not quiet:
+        click.echo(copier.get_summary())
 
     errors.extend(copy_list_errors)
     errors.extend(copy_errors)
@@ -482,13 +622,26 @@ OUTPUT: Path to a directory or a zip file where sources will be copied to.
     type=click.Path(
         exists=True, file_okay=True, dir_okay=True, readable=True, resolve_path=True))
 
+@click.option('--ignore',
+    multiple=True,
+    metavar='PATTERN',
+    help='Ignore files and directories matching this glob PATTERN. '
+         'Ignored directories are not walked. Can be repeated.')
+
+@click.option('--processes',
+    type=click.IntRange(min=1),
+    metavar='N',
+    default=1,
+    show_default=True,
+    help='Use up to N processes to load and validate ABOUT files in parallel.')
+
 @click.option('--verbose',
     is_flag=True,
     help='Show all error and warning messages.')
 
 @click.help_option('-h', '--help')
 
-def check(location, verbose):
+def check(location, ignore, processes, verbose):
     """
 Check .ABOUT file(s) at LOCATION for validity and print error messages.
 
@@ -496,8 +649,7 @@ LOCATION: Path to an ABOUT file or a directory with ABOUT files.
     """
     print_version()
     click.echo('Checking ABOUT files...')
-    errors, _abouts = collect_inventory(location)
-    errors = unique(errors)
+    errors, _abouts = collect_inventory(location, processes=processes, ignores=ignore)
     severe_errors_count = report_errors(errors, quiet=False, verbose=verbose)
     sys.exit(severe_errors_count)
 
@@ -583,7 +735,6 @@ OUTPUT: Path to CSV/JSON inventory file to create.
         print_version()
         click.echo('Transforming...')
 
-    errors = unique(errors)
     errors_count = report_errors(errors, quiet, verbose, log_file_loc=output + '-error.log')
     if not quiet and not errors:
         msg = 'Transformed file is written to {output}.'.format(**locals())
@@ -619,9 +770,8 @@ def get_error_messages(errors, quiet=False, verbose=False):
     """
     Return a tuple of (list of error message strings to report,
     severe_errors_count) given an `errors` list of Error objects and using the
-    `quiet` and `verbose` flags.
+    `quiet` and `verbose` flags. The `errors` are expected to be unique.
     """
-    errors = unique(errors)
     severe_errors = filter_errors(errors, WARNING)
     severe_errors_count = len(severe_errors)
 
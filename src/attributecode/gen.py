@@ -20,6 +20,10 @@ from __future__ import unicode_literals
 
 import codecs
 from collections import OrderedDict
+from functools import partial
+from itertools import islice
+from multiprocessing.pool import ThreadPool
+import os
 
 # FIXME: why posipath???
 from posixpath import basename
@@ -52,8 +56,14 @@ def check_duplicated_columns(location):
     with codecs.open(location, 'rb', encoding='utf-8-sig', errors='replace') as csvfile:
         reader = csv.reader(csvfile)
         columns = next(reader)
-        columns = [col for col in columns]
+    return check_duplicated_column_names(columns)
 
+
+def check_duplicated_column_names(columns):
+    """
+    Return a list of errors for duplicated names in a `columns` list of CSV
+    column names.
+    """
     seen = set()
     dupes = OrderedDict()
     for col in columns:
@@ -78,15 +88,19 @@ def check_duplicated_columns(location):
         errors.append(Error(ERROR, msg))
     return unique(errors)
 
-def check_duplicated_about_resource(arp, arp_list):
+def get_duplicated_about_resources_errors(rows_by_arp):
     """
-    Return error for duplicated about_resource.
+    Return a list of errors for the duplicated about_resource values of a
+    `rows_by_arp` mapping of {about_resource: [list of row numbers]}.
     """
-    if arp in arp_list:
-        msg = ("The input has duplicated values in 'about_resource' "
-               "field: " + arp)
-        return Error(CRITICAL, msg)
-    return ''
+    errors = []
+    for arp, rows in rows_by_arp.items():
+        if len(rows) > 1:
+            rows = ', '.join(str(row) for row in rows)
+            msg = ("The input has duplicated values in 'about_resource' "
+                   "field: %(arp)s (rows: %(rows)s)" % locals())
+            errors.append(Error(CRITICAL, msg))
+    return errors
 
 def check_newline_in_file_field(component):
     """
@@ -116,71 +130,135 @@ def check_about_resource_filename(arp):
     return ''
 
 # TODO: this should be either the CSV or the ABOUT files but not both???
-def load_inventory(location, base_dir, reference_dir=None):
+def read_inventory(location):
     """
-    Load the inventory file at `location` for ABOUT and LICENSE files stored in
-    the `base_dir`. Return a list of errors and a list of About objects
-    validated against the `base_dir`.
+    Return a tuple of (list of errors, iterator of mappings) for the
+    components of the CSV or JSON inventory at `location`.
 
-    Optionally use `reference_dir` as the directory location of extra reference
-    license and notice files to reuse.
+    The CSV rows are read lazily, after checking the column names read from
+    the header with the same reader.
     """
-    errors = []
-    abouts = []
-    base_dir = util.to_posix(base_dir)
     # FIXME: do not mix up CSV and JSON
-    if location.endswith('.csv'):
-        # FIXME: this should not be done here.
-        dup_cols_err = check_duplicated_columns(location)
-        if dup_cols_err:
-            errors.extend(dup_cols_err)
-            return errors, abouts
-        inventory = util.load_csv(location)
-    else:
-        inventory = util.load_json(location)
+    if not location.endswith('.csv'):
+        return [], iter(util.load_json(location))
+
+    # FIXME: why ignore encoding errors here?
+    csvfile = codecs.open(add_unc(location), mode='rb', encoding='utf-8-sig',
+                          errors='ignore')
+    reader = csv.DictReader(csvfile)
+    # FIXME: this should not be done here.
+    errors = check_duplicated_column_names(reader.fieldnames or [])
+    if errors:
+        csvfile.close()
+        return errors, iter([])
+    return [], iter_and_close(util.iter_csv_rows(reader), csvfile)
+
+
+def iter_and_close(rows, csvfile):
+    """
+    Yield the `rows` read from an opened `csvfile` and close this file once
+    all the rows are read.
+    """
+    try:
+        for row in rows:
+            yield row
+    finally:
+        csvfile.close()
 
+
+def iter_checked_inventory(location, errors):
+    """
+    Yield the components of the CSV or JSON inventory at `location`, read
+    lazily, after checking each of them. Append to an `errors` list the errors
+    that prevent loading them: duplicated columns or about_resource values,
+    newlines in file fields and invalid about_resource values.
+
+    The duplicated about_resource values are only known and reported once all
+    the components are read: this iterator must be exhausted before using the
+    `errors`. Only the about_resource values are kept in memory.
+    """
+    read_errors, inventory = read_inventory(location)
+    if read_errors:
+        errors.extend(read_errors)
+        return
+
+    # the number of the first row: CSV rows are numbered after the header
+    first_row = 1
+    if location.endswith('.csv'):
+        first_row = 2
+    rows_by_arp = OrderedDict()
+    component_errors = []
     try:
-        arp_list = []
-        errors = []
-        for component in inventory:
+        for row, component in enumerate(inventory, first_row):
             arp = component['about_resource']
-            dup_err = check_duplicated_about_resource(arp, arp_list)
-            if dup_err:
-                errors.append(dup_err)
-            else:
-                arp_list.append(arp)
-
+            rows_by_arp.setdefault(arp, []).append(row)
             newline_in_file_err = check_newline_in_file_field(component)
             for err in newline_in_file_err:
-                errors.append(err)
+                component_errors.append(err)
 
             invalid_about_filename = check_about_resource_filename(arp)
             if invalid_about_filename:
-                errors.append(invalid_about_filename)
-        if errors:
-            return errors, abouts
+                component_errors.append(invalid_about_filename)
+            yield component
 
     except Exception as e:
         # TODO: why catch ALL Exception
         msg = "The essential field 'about_resource' is not found in the <input>"
         errors.append(Error(CRITICAL, msg))
-        return errors, abouts
+        return
 
-    for i, fields in enumerate(inventory):
-        # check does the input contains the required fields
-        required_fields = model.About.required_fields
+    errors.extend(get_duplicated_about_resources_errors(rows_by_arp))
+    errors.extend(component_errors)
 
+
+def check_inventory(location):
+    """
+    Return a list of errors for the components of the CSV or JSON inventory at
+    `location` that prevent loading them. See iter_checked_inventory().
+    """
+    errors = []
+    for _component in iter_checked_inventory(location, errors):
+        pass
+    return errors
+
+
+def iter_inventory_abouts(location, base_dir, reference_dir=None, path_index=None):
+    """
+    Yield a tuple of (list of errors, About object or None) for each component
+    of the inventory file at `location`, read lazily, for ABOUT and LICENSE
+    files stored in the `base_dir`. The About objects are validated against
+    the `base_dir`. The inventory must have been checked with
+    check_inventory() first.
+
+    Optionally use `reference_dir` as the directory location of extra reference
+    license and notice files to reuse, and a `path_index` util.PathIndex or
+    ZipIndex to access the files.
+    """
+    _errors, inventory = read_inventory(location)
+    return iter_components_abouts(inventory, base_dir, reference_dir, path_index)
+
+
+def iter_components_abouts(inventory, base_dir, reference_dir=None, path_index=None):
+    """
+    Yield a tuple of (list of errors, About object or None) for each component
+    mapping of an `inventory` iterable. See iter_inventory_abouts().
+    """
+    base_dir = util.to_posix(base_dir)
+    # check does the input contains the required fields
+    required_fields = model.About.required_fields
+
+    for fields in inventory:
         for f in required_fields:
             if f not in fields:
                 msg = "Required field: %(f)r not found in the <input>" % locals()
-                errors.append(Error(ERROR, msg))
-                return errors, abouts
+                yield [Error(ERROR, msg)], None
+                return
         afp = fields.get(model.About.ABOUT_RESOURCE_ATTR)
 
         # FIXME: this should not be a failure condition
         if not afp or not afp.strip():
             msg = 'Empty column: %(afp)r. Cannot generate .ABOUT file.' % locals()
-            errors.append(Error(ERROR, msg))
+            yield [Error(ERROR, msg)], None
             continue
         else:
             afp = util.to_posix(afp)
@@ -204,6 +282,7 @@ def load_inventory(location, base_dir, reference_dir=None):
             base_dir,
             running_inventory=False,
             reference_dir=reference_dir,
+            path_index=path_index,
         )
         """
         # 'about_resource' field will be generated during the process.
@@ -212,23 +291,91 @@ def load_inventory(location, base_dir, reference_dir=None):
             if e.message == 'Field about_resource is required':
                 ld_errors.remove(e)
         """
-        for e in ld_errors:
-            if not e in errors:
-                errors.extend(ld_errors)
-        abouts.append(about)
+        yield ld_errors, about
+
+
+def load_inventory(location, base_dir, reference_dir=None, path_index=None):
+    """
+    Load the inventory file at `location` for ABOUT and LICENSE files stored in
+    the `base_dir`. Return a list of errors and a list of About objects
+    validated against the `base_dir`.
+
+    Optionally use `reference_dir` as the directory location of extra reference
+    license and notice files to reuse, and a `path_index` util.PathIndex or
+    ZipIndex to access the files.
+
+    The inventory is read once: all the components are checked before any is
+    loaded, as loading may copy reference license and notice files in the
+    `base_dir`.
+    """
+    errors = []
+    components = list(iter_checked_inventory(location, errors))
+    if errors:
+        return errors, []
+
+    abouts = []
+    for ld_errors, about in iter_components_abouts(
+            components, base_dir, reference_dir, path_index):
+        # duplicated errors are removed once at the end
+        errors.extend(ld_errors)
+        if about is not None:
+            abouts.append(about)
 
     return unique(errors), abouts
 
+
+def get_license_about(fields):
+    """
+    Return an About object loaded with only the license_expression of a
+    `fields` inventory component mapping.
+    """
+    about = model.About()
+    fields = OrderedDict(
+        (key, value) for key, value in fields.items()
+        if key.lower() == 'license_expression')
+    if fields:
+        about.load_dict(fields, base_dir='')
+    return about
+
 def update_about_resource(self):
     pass
 
-def generate(location, base_dir, android=None, reference_dir=None, fetch_license=False):
+def generate(location, base_dir, android=None, reference_dir=None, fetch_license=False,
+             license_cache=None, offline=False, fetch_timeout=10, workers=1):
     """
     Load ABOUT data from a CSV inventory at `location`. Write ABOUT files to
     base_dir. Return errors and about objects.
+
+    When fetching licenses, use the `license_cache` LicenseCache if provided
+    and only this cache if `offline` is True. Give up fetching if the license
+    API does not respond within `fetch_timeout` seconds.
+
+    Use up to `workers` threads to write the files. The errors are always
+    returned in the same order as when writing the files sequentially.
+    """
+    errors = []
+    abouts = []
+    for about_errors, about in iter_generate(
+            location, base_dir, android=android, reference_dir=reference_dir,
+            fetch_license=fetch_license, license_cache=license_cache,
+            offline=offline, fetch_timeout=fetch_timeout, workers=workers):
+        errors.extend(about_errors)
+        if about is not None:
+            abouts.append(about)
+    return unique(errors), abouts
+
+
+def iter_generate(location, base_dir, android=None, reference_dir=None, fetch_license=False,
+                  license_cache=None, offline=False, fetch_timeout=10, workers=1):
+    """
+    Load ABOUT data from a CSV inventory at `location` and write ABOUT files to
+    base_dir as with generate(). Yield a tuple of (list of errors, About object
+    or None) for each ABOUT file once written.
+
+    The inventory is read lazily and only the About objects being written are
+    kept in memory, such that the memory used does not grow with the size of
+    the inventory.
     """
-    not_exist_errors = []
-    notice_dict = {}
     api_url = ''
     api_key = ''
     gen_license = False
@@ -243,123 +390,233 @@ def generate(location, base_dir, android=None, reference_dir=None, fetch_license
     # TODO: WHY use posix??
     bdir = to_posix(base_dir)
 
-    errors, abouts = load_inventory(
+    # The inventory is read twice: no file is written unless the whole
+    # inventory is valid and the licenses are all fetched at once before
+    # writing the files. The first pass checks the inventory and collects its
+    # unique license expressions. The second pass loads and writes the
+    # About objects such that they never all stay in memory.
+    errors = []
+    license_fields = OrderedDict()
+    for component in iter_checked_inventory(location, errors):
+        if gen_license:
+            fields = tuple((key, value) for key, value in component.items()
+                           if key.lower() == 'license_expression')
+            license_fields[fields] = None
+    if errors:
+        yield errors, None
+        return
+
+    license_dict = None
+    if gen_license:
+        # only the license expressions are loaded to collect the license keys
+        license_dict, err = model.pre_process_and_fetch_license_dict(
+            (get_license_about(OrderedDict(fields)) for fields in license_fields),
+            api_url, api_key, license_cache=license_cache, offline=offline,
+            timeout=fetch_timeout)
+        if err:
+            yield err, None
+
+    write = partial(
+        write_about_files,
+        base_dir=bdir,
+        license_dict=license_dict,
+        android=android)
+
+    loaded = iter_inventory_abouts(
         location=location,
         base_dir=bdir,
         reference_dir=reference_dir
     )
 
-    if gen_license:
-        license_dict, err = model.pre_process_and_fetch_license_dict(abouts, api_url, api_key)
-        if err:
-            for e in err:
-                # Avoid having same error multiple times
-                if not e in errors:
-                    errors.append(e)
-
-    for about in abouts:
-        if about.about_file_path.startswith('/'):
-            about.about_file_path = about.about_file_path.lstrip('/')
-        dump_loc = join(bdir, about.about_file_path.lstrip('/'))
-
-        # The following code is to check if there is any directory ends with spaces
-        split_path = about.about_file_path.split('/')
-        dir_endswith_space = False
-        for segment in split_path:
-            if segment.endswith(' '):
-                msg = (u'File path : '
-                       u'%(dump_loc)s '
-                       u'contains directory name ends with spaces which is not '
-                       u'allowed. Generation skipped.' % locals())
-                errors.append(Error(ERROR, msg))
-                dir_endswith_space = True
-                break
-        if dir_endswith_space:
-            # Continue to work on the next about object
-            continue
+    notice_dict = {}
+    pool = None
+    # the number of About objects loaded and written at once
+    chunk_size = 1
+    if workers and workers > 1:
+        pool = ThreadPool(workers)
+        chunk_size = workers * 16
 
-        try:
-            # Generate value for 'about_resource' if it does not exist
-            if not about.about_resource.value:
-                about.about_resource.value = OrderedDict()
-                about_resource_value = ''
-                if about.about_file_path.endswith('/'):
-                    about_resource_value = u'.'
-                else:
-                    about_resource_value = basename(about.about_file_path)
-                about.about_resource.value[about_resource_value] = None
-                about.about_resource.present = True
-                # Check for the existence of the 'about_resource'
-                # If the input already have the 'about_resource' field, it will
-                # be validated when creating the about object
-                loc = util.to_posix(dump_loc)
-                about_file_loc = loc
-                path = join(dirname(util.to_posix(about_file_loc)), about_resource_value)
-                if not exists(path):
-                    path = util.to_posix(path.strip(UNC_PREFIX_POSIX))
-                    path = normpath(path)
-                    msg = (u'Field about_resource: '
-                           u'%(path)s '
-                           u'does not exist' % locals())
-                    not_exist_errors.append(msg)
-
-            licenses_dict = {}
-            if gen_license:
-                # Write generated LICENSE file
-                license_key_name_context_url_list = about.dump_lic(dump_loc, license_dict)
-                if license_key_name_context_url_list:
-                    for lic_key, lic_name, lic_context, lic_url in license_key_name_context_url_list:
-                        licenses_dict[lic_key] = [lic_name, lic_context, lic_url]
-                        gen_license_name = lic_key + u'.LICENSE'
-                        if not lic_name in about.license_name.value:
-                            about.license_name.value.append(lic_name)
-                        about.license_file.value[gen_license_name] = license_dict[lic_key][1]
-                        if not lic_url in about.license_url.value:
-                            about.license_url.value.append(lic_url)
-
-                        if about.license_name.value:
-                            about.license_name.present = True
-                        if about.license_file.value:
-                            about.license_file.present = True
-                        if about.license_url.value:
-                            about.license_url.present = True
-
-            about.dump(dump_loc, licenses_dict)
-
-            if android:
-                """
-                Create MODULE_LICENSE_XXX and get context to create NOTICE file
-                follow the standard from Android Open Source Project
-                """
-                import os
-                parent_path = os.path.dirname(util.to_posix(dump_loc))
-
-                about.android_module_license(parent_path)
-                notice_path, notice_context = about.android_notice(parent_path)
-                if notice_path in notice_dict.keys():
-                    notice_dict[notice_path] += '\n\n' + notice_context
+    try:
+        while True:
+            chunk = list(islice(loaded, chunk_size))
+            if not chunk:
+                break
+            # {id(about): Error} for the abouts that cannot be written
+            path_errors = {}
+            abouts = []
+            for _ld_errors, about in chunk:
+                if about is None:
+                    continue
+                if about.about_file_path.startswith('/'):
+                    about.about_file_path = about.about_file_path.lstrip('/')
+                path_error = check_about_file_path(about, bdir)
+                if path_error:
+                    path_errors[id(about)] = path_error
                 else:
-                    notice_dict[notice_path] = notice_context
-
-            for e in not_exist_errors:
-                errors.append(Error(INFO, e))
-
-        except Exception as e:
-            # only keep the first 100 char of the exception
-            # TODO: truncated errors are likely making diagnotics harder
-            emsg = repr(e)[:100]
-            msg = (u'Failed to write .ABOUT file at : '
-                   u'%(dump_loc)s '
-                   u'with error: %(emsg)s' % locals())
-            errors.append(Error(ERROR, msg))
+                    abouts.append(about)
+
+            # create the parent directories upfront such that concurrent
+            # writes never race to create the same directory
+            for parent in sorted(set(get_parent_dir(bdir, about) for about in abouts)):
+                if not exists(parent):
+                    try:
+                        os.makedirs(add_unc(parent))
+                    except OSError:
+                        # reported as an error when writing the ABOUT file
+                        pass
+
+            if pool:
+                # imap returns results in the order of the abouts such that
+                # the errors are always reported in the same order
+                results = pool.imap(write, abouts)
+            else:
+                results = map(write, abouts)
+            results = iter(results)
+
+            for ld_errors, about in chunk:
+                if about is None:
+                    yield ld_errors, None
+                    continue
+                path_error = path_errors.get(id(about))
+                if path_error:
+                    yield ld_errors + [path_error], about
+                    continue
+                about_errors, notice = next(results)
+                if notice:
+                    notice_path, notice_context = notice
+                    if notice_path in notice_dict:
+                        notice_dict[notice_path] += '\n\n' + notice_context
+                    else:
+                        notice_dict[notice_path] = notice_context
+                yield ld_errors + about_errors, about
+    finally:
+        if pool:
+            pool.close()
+            pool.join()
 
     if android:
         # Check if there is already a NOTICE file present
         for path in notice_dict.keys():
             if os.path.exists(path):
                 msg = (u'NOTICE file already exist at: %s' % path)
-                errors.append(Error(ERROR, msg))
+                yield [Error(ERROR, msg)], None
             else:
-                about.dump_android_notice(path, notice_dict[path])
+                model.About.dump_android_notice(path, notice_dict[path])
 
-    return unique(errors), abouts
+
+def get_parent_dir(base_dir, about):
+    """
+    Return the parent directory of the ABOUT file of an `about` About object
+    generated in `base_dir`.
+    """
+    dump_loc = join(base_dir, about.about_file_path.lstrip('/'))
+    return dirname(util.to_posix(dump_loc))
+
+
+def check_about_file_path(about, base_dir):
+    """
+    Return an Error if the ABOUT file path of an `about` About object contains
+    a directory name that ends with spaces, or None otherwise.
+    """
+    # The following code is to check if there is any directory ends with spaces
+    split_path = about.about_file_path.split('/')
+    for segment in split_path:
+        if segment.endswith(' '):
+            dump_loc = join(base_dir, about.about_file_path.lstrip('/'))
+            msg = (u'File path : '
+                   u'%(dump_loc)s '
+                   u'contains directory name ends with spaces which is not '
+                   u'allowed. Generation skipped.' % locals())
+            return Error(ERROR, msg)
+
+
+def write_about_files(about, base_dir, license_dict=None, android=False):
+    """
+    Write the ABOUT file of an `about` About object in `base_dir` and its
+    LICENSE files using the `license_dict` fetched license data if provided
+    and its Android MODULE_LICENSE_XXX files if `android` is True.
+
+    Return a tuple of (list of errors, Android (NOTICE path, NOTICE text) or
+    None). This is thread-safe when the parent directory already exists.
+    """
+    errors = []
+    notice = None
+    dump_loc = join(base_dir, about.about_file_path.lstrip('/'))
+
+    path_error = check_about_file_path(about, base_dir)
+    if path_error:
+        errors.append(path_error)
+        return errors, notice
+
+    not_exist_errors = []
+    try:
+        # Generate value for 'about_resource' if it does not exist
+        if not about.about_resource.value:
+            about.about_resource.value = OrderedDict()
+            about_resource_value = ''
+            if about.about_file_path.endswith('/'):
+                about_resource_value = u'.'
+            else:
+                about_resource_value = basename(about.about_file_path)
+            about.about_resource.value[about_resource_value] = None
+            about.about_resource.present = True
+            # Check for the existence of the 'about_resource'
+            # If the input already have the 'about_resource' field, it will
+            # be validated when creating the about object
+            loc = util.to_posix(dump_loc)
+            about_file_loc = loc
+            path = join(dirname(util.to_posix(about_file_loc)), about_resource_value)
+            if not exists(path):
+                path = util.to_posix(path.strip(UNC_PREFIX_POSIX))
+                path = normpath(path)
+                msg = (u'Field about_resource: '
+                       u'%(path)s '
+                       u'does not exist' % locals())
+                not_exist_errors.append(msg)
+
+        licenses_dict = {}
+        if license_dict is not None:
+            # Write generated LICENSE file
+            license_key_name_context_url_list = about.dump_lic(dump_loc, license_dict)
+            if license_key_name_context_url_list:
+                for lic_key, lic_name, lic_context, lic_url in license_key_name_context_url_list:
+                    licenses_dict[lic_key] = [lic_name, lic_context, lic_url]
+                    gen_license_name = lic_key + u'.LICENSE'
+                    if not lic_name in about.license_name.value:
+                        about.license_name.value.append(lic_name)
+                    about.license_file.value[gen_license_name] = license_dict[lic_key][1]
+                    if not lic_url in about.license_url.value:
+                        about.license_url.value.append(lic_url)
+
+                    if about.license_name.value:
+                        about.license_name.present = True
+                    if about.license_file.value:
+                        about.license_file.present = True
+                    if about.license_url.value:
+                        about.license_url.present = True
+
+        about.dump(dump_loc, licenses_dict)
+
+        if android:
+            """
+            Create MODULE_LICENSE_XXX and get context to create NOTICE file
+            follow the standard from Android Open Source Project
+            """
+            parent_path = os.path.dirname(util.to_posix(dump_loc))
+
+            about.android_module_license(parent_path)
+            notice = about.android_notice(parent_path)
+
+        for e in not_exist_errors:
+            errors.append(Error(INFO, e))
+
+    except Exception as e:
+        # only keep the first 100 char of the exception
+        # TODO: truncated errors are likely making diagnotics harder
+        emsg = repr(e)[:100]
+        msg = (u'Failed to write .ABOUT file at : '
+               u'%(dump_loc)s '
+               u'with error: %(emsg)s' % locals())
+        errors.append(Error(ERROR, msg))
+
+    return errors, notice
@@ -29,11 +29,14 @@ from __future__ import print_function
 from __future__ import unicode_literals
 
 from collections import OrderedDict
+from functools import partial
 import io
 import json
+import multiprocessing
 import os
 # FIXME: why posixpath???
 import posixpath
+import threading
 import traceback
 
 from attributecode.util import python2, to_posix
@@ -41,13 +44,10 @@ from attributecode.util import python2, to_posix
 if python2:  # pragma: nocover
     from itertools import izip_longest as zip_longest  # NOQA
     from urlparse import urljoin, urlparse  # NOQA
-    from urllib2 import urlopen, Request, HTTPError  # NOQA
 else:  # pragma: nocover
     basestring = str  # NOQA
     from itertools import zip_longest  # NOQA
     from urllib.parse import urljoin, urlparse  # NOQA
-    from urllib.request import urlopen, Request  # NOQA
-    from urllib.error import HTTPError  # NOQA
 
 from license_expression import Licensing
 
@@ -63,15 +63,13 @@ from attributecode import util
 from attributecode.util import add_unc
 from attributecode.util import boolean_fields
 from attributecode.util import copy_license_notice_files
-from attributecode.util import copy_file
 from attributecode.util import csv
 from attributecode.util import file_fields
 from attributecode.util import filter_errors
 from attributecode.util import is_valid_name
 from attributecode.util import on_windows
 from attributecode.util import norm
-from attributecode.util import replace_tab_with_spaces
-from attributecode.util import wrap_boolean_value
+from attributecode.util import prepare_about_text
 from attributecode.util import UNC_PREFIX
 from attributecode.util import ungroup_licenses
 from attributecode.util import unique
@@ -85,6 +83,14 @@ class Field(object):
     An ABOUT file field. The initial value is a string. Subclasses can and
     will alter the value type as needed.
     """
+    __slots__ = (
+        'name',
+        'original_value',
+        'value',
+        'required',
+        'present',
+        'errors',
+    )
 
     def __init__(self, name=None, value=None, required=False, present=False):
         # normalized names are lowercased per specification
@@ -239,6 +245,8 @@ class StringField(Field):
     A field containing a string value possibly on multiple lines.
     The validated value is a string.
     """
+    __slots__ = ()
+
     def _validate(self, *args, **kwargs):
         errors = super(StringField, self)._validate(*args, ** kwargs)
         no_special_char_field = ['license_expression', 'license_key', 'license_name']
@@ -286,6 +294,8 @@ class SingleLineField(StringField):
     A field containing a string value on a single line. The validated value is
     a string.
     """
+    __slots__ = ()
+
     def _validate(self, *args, **kwargs):
         errors = super(SingleLineField, self)._validate(*args, ** kwargs)
         if self.value and isinstance(self.value, basestring) and '\n' in self.value:
@@ -302,6 +312,8 @@ class ListField(StringField):
     A field containing a list of string values, one per line. The validated
     value is a list.
     """
+    __slots__ = ()
+
     def default_value(self):
         return []
 
@@ -368,6 +380,8 @@ class PackageUrlField(StringField):
     """
     A Package URL field. The validated value is a purl.
     """
+    __slots__ = ()
+
     def _validate(self, *args, **kwargs):
         """
         Check that Package URL is valid. Return a list of errors.
@@ -394,6 +408,8 @@ class UrlListField(ListField):
     """
     A URL field. The validated value is a list of URLs.
     """
+    __slots__ = ()
+
     def _validate(self, *args, **kwargs):
         """
         Check that URLs are valid. Return a list of errors.
@@ -421,6 +437,8 @@ class UrlField(StringField):
     """
     A URL field. The validated value is a URL.
     """
+    __slots__ = ()
+
     def _validate(self, *args, **kwargs):
         """
         Check that URL is valid. Return a list of errors.
@@ -449,6 +467,13 @@ class PathField(ListField):
     The validated value is an ordered dict of path->location or None.
     The paths can also be resolved
     """
+    __slots__ = (
+        'about_file_path',
+        'running_inventory',
+        'base_dir',
+        'reference_dir',
+    )
+
     def default_value(self):
         return {}
 
@@ -459,12 +484,17 @@ class PathField(ListField):
 
         base_dir is the directory location of the ABOUT file used to resolve
         relative paths to actual file locations.
+
+        path_index is an optional util.PathIndex used to check the existence of
+        the paths with fewer file system calls.
         """
         errors = super(PathField, self)._validate(*args, ** kwargs)
         self.about_file_path = kwargs.get('about_file_path')
         self.running_inventory = kwargs.get('running_inventory')
         self.base_dir = kwargs.get('base_dir')
         self.reference_dir = kwargs.get('reference_dir')
+        path_index = kwargs.get('path_index')
+        exists = path_index.exists if path_index else os.path.exists
 
         if self.base_dir:
             self.base_dir = util.to_posix(self.base_dir)
@@ -522,12 +552,11 @@ class PathField(ListField):
                     else:
                         location = posixpath.join(self.base_dir, path)
         
-                location = util.to_native(location)
-                location = os.path.abspath(os.path.normpath(location))
-                location = util.to_posix(location)
+                # abspath also normalizes the path
+                location = util.to_posix(os.path.abspath(util.to_native(location)))
                 location = add_unc(location)
         
-                if not os.path.exists(location):
+                if not exists(location):
                     # We don't want to show the UNC_PREFIX in the error message
                     location = util.to_posix(location.strip(UNC_PREFIX))
                     msg = (u'Field %(name)s: Path %(location)s not found'
@@ -550,6 +579,8 @@ class AboutResourceField(PathField):
     Special field for about_resource. self.resolved_paths contains a list of
     the paths resolved relative to the about file path.
     """
+    __slots__ = ('resolved_paths',)
+
     def __init__(self, *args, ** kwargs):
         super(AboutResourceField, self).__init__(*args, ** kwargs)
         self.resolved_paths = []
@@ -558,12 +589,18 @@ class AboutResourceField(PathField):
         errors = super(AboutResourceField, self)._validate(*args, ** kwargs)
         return errors
 
+# shared cache of the texts loaded by FileTextFields
+file_texts = util.TextCache()
+
+
 class FileTextField(PathField):
     """
     A path field pointing to one or more text files such as license files.
     The validated value is an ordered dict of path->Text or None if no
     location or text could not be loaded.
     """
+    __slots__ = ()
+
     def _validate(self, *args, **kwargs):
         """
         Load and validate the texts referenced by paths fields. Return a list
@@ -584,9 +621,7 @@ class FileTextField(PathField):
             try:
                 # TODO: we have lots the location by replacing it with a text
                 location = add_unc(location)
-                with io.open(location, encoding='utf-8') as txt:
-                    text = txt.read()
-                self.value[path] = text
+                self.value[path] = file_texts.get(location, kwargs.get('path_index'))
             except Exception as e:
                 # only keep the first 100 char of the exception
                 emsg = repr(e)[:100]
@@ -602,6 +637,8 @@ class BooleanField(SingleLineField):
     """
     An flag field with a boolean value. Validated value is False, True or None.
     """
+    __slots__ = ('about_file_path',)
+
     def default_value(self):
         return None
 
@@ -696,10 +733,11 @@ class BooleanField(SingleLineField):
 
 
 def validate_fields(fields, about_file_path, running_inventory, base_dir,
-                    reference_dir=None):
+                    reference_dir=None, path_index=None):
     """
     Validate a sequence of Field objects. Return a list of errors.
     Validation may update the Field objects as needed as a side effect.
+    Use the optional `path_index` util.PathIndex to check paths existence.
     """
     errors = []
     for f in fields:
@@ -708,6 +746,7 @@ def validate_fields(fields, about_file_path, running_inventory, base_dir,
             about_file_path=about_file_path,
             running_inventory=running_inventory,
             reference_dir=reference_dir,
+            path_index=path_index,
         )
         errors.extend(val_err)
     return errors
@@ -739,73 +778,135 @@ class About(object):
     # Required fields
     required_fields = ['name', ABOUT_RESOURCE_ATTR]
 
+    # Standard fields as (name, Field class, required) tuples. The order of
+    # this schema is the standard ordering of fields.
+    standard_fields = (
+        ('about_resource', AboutResourceField, True),
+        ('name', SingleLineField, True),
+        ('version', SingleLineField, False),
+
+        ('download_url', UrlField, False),
+        ('description', StringField, False),
+        ('homepage_url', UrlField, False),
+        ('package_url', PackageUrlField, False),
+        ('notes', StringField, False),
+
+        ('license_expression', StringField, False),
+        ('license_key', ListField, False),
+        ('license_name', ListField, False),
+        ('license_file', FileTextField, False),
+        ('license_url', UrlListField, False),
+        ('copyright', StringField, False),
+        ('notice_file', FileTextField, False),
+        ('notice_url', UrlField, False),
+
+        ('redistribute', BooleanField, False),
+        ('attribute', BooleanField, False),
+        ('track_changes', BooleanField, False),
+        ('modified', BooleanField, False),
+        ('internal_use_only', BooleanField, False),
+
+        ('changelog_file', FileTextField, False),
+
+        ('owner', StringField, False),
+        ('owner_url', UrlField, False),
+        ('contact', StringField, False),
+        ('author', StringField, False),
+        ('author_file', FileTextField, False),
+
+        ('vcs_tool', SingleLineField, False),
+        ('vcs_repository', SingleLineField, False),
+        ('vcs_path', SingleLineField, False),
+        ('vcs_tag', SingleLineField, False),
+        ('vcs_branch', SingleLineField, False),
+        ('vcs_revision', SingleLineField, False),
+
+        ('checksum_md5', SingleLineField, False),
+        ('checksum_sha1', SingleLineField, False),
+        ('checksum_sha256', SingleLineField, False),
+        ('spec_version', SingleLineField, False),
+    )
+
+    # Standard field names in the standard order
+    standard_field_names = tuple(name for name, _cls, _req in standard_fields)
+
+    # {name: (Field class, required)} for each standard field
+    standard_fields_by_name = dict(
+        (name, (field_class, required))
+        for name, field_class, required in standard_fields)
+
+    __slots__ = (
+        'fields',
+        'custom_fields',
+        'errors',
+        'about_file_path',
+        'location',
+        'base_dir',
+        'reference_dir',
+        # set when generating an attribution
+        'license_name_expression',
+    )
+
     def get_required_fields(self):
-        return [f for f in self.fields if f.required]
+        return [self.get_field(name) for name in self.required_fields]
 
     def set_standard_fields(self):
         """
-        Create fields in an ordered dict to keep a standard ordering. We
-        could use a metaclass to track ordering django-like but this approach
-        is simpler.
-        """
-        self.fields = OrderedDict([
-            ('about_resource', AboutResourceField(required=True)),
-            ('name', SingleLineField(required=True)),
-            ('version', SingleLineField()),
-
-            ('download_url', UrlField()),
-            ('description', StringField()),
-            ('homepage_url', UrlField()),
-            ('package_url', PackageUrlField()),
-            ('notes', StringField()),
-
-            ('license_expression', StringField()),
-            ('license_key', ListField()),
-            ('license_name', ListField()),
-            ('license_file', FileTextField()),
-            ('license_url', UrlListField()),
-            ('copyright', StringField()),
-            ('notice_file', FileTextField()),
-            ('notice_url', UrlField()),
-
-            ('redistribute', BooleanField()),
-            ('attribute', BooleanField()),
-            ('track_changes', BooleanField()),
-            ('modified', BooleanField()),
-            ('internal_use_only', BooleanField()),
-
-            ('changelog_file', FileTextField()),
-
-            ('owner', StringField()),
-            ('owner_url', UrlField()),
-            ('contact', StringField()),
-            ('author', StringField()),
-            ('author_file', FileTextField()),
-
-            ('vcs_tool', SingleLineField()),
-            ('vcs_repository', SingleLineField()),
-            ('vcs_path', SingleLineField()),
-            ('vcs_tag', SingleLineField()),
-            ('vcs_branch', SingleLineField()),
-            ('vcs_revision', SingleLineField()),
-
-            ('checksum_md5', SingleLineField()),
-            ('checksum_sha1', SingleLineField()),
-            ('checksum_sha256', SingleLineField()),
-            ('spec_version', SingleLineField()),
-        ])
-
-        for name, field in self.fields.items():
-            # we could have a hack to get the actual field name
-            # but setting an attribute is explicit and cleaner
-            field.name = name
-            setattr(self, name, field)
-
-    def __init__(self, location=None, about_file_path=None, strict=False):
+        Create the required fields. The other standard fields are created
+        on first access with get_field() as absent fields only hold their
+        default value.
+        """
+        self.fields = {}
+        for name in self.required_fields:
+            self.get_field(name)
+
+    def new_field(self, name):
+        """
+        Return a new absent standard Field named `name`.
+        """
+        field_class, required = self.standard_fields_by_name[name]
+        return field_class(name=name, required=required)
+
+    def get_field(self, name):
+        """
+        Return the standard Field named `name`, creating it if needed.
+        """
+        field = self.fields.get(name)
+        if field is None:
+            field = self.fields[name] = self.new_field(name)
+        return field
+
+    def __getattr__(self, name):
+        """
+        Return a standard or custom Field object as an attribute. This is
+        called only when there is no regular attribute with this `name`.
+        """
+        if name.startswith('__') or name in self.__slots__:
+            # an unset slot or a special lookup, such as when unpickling
+            raise AttributeError(name)
+        if name in self.standard_fields_by_name:
+            return self.get_field(name)
+        custom_fields = getattr(self, 'custom_fields', None)
+        if custom_fields and name in custom_fields:
+            return custom_fields[name]
+        raise AttributeError(name)
+
+    def __getstate__(self):
+        return dict((name, getattr(self, name)) for name in self.__slots__
+                    if hasattr(self, name))
+
+    def __setstate__(self, state):
+        for name, value in state.items():
+            setattr(self, name, value)
+
+    def __init__(self, location=None, about_file_path=None, strict=False,
+                 path_index=None):
         """
         Create an instance.
         If strict is True, raise an Exception on errors. Otherwise the errors
         attribute contains the errors.
+        Use the optional `path_index` util.PathIndex to check the existence of
+        the paths referenced in the loaded ABOUT file.
         """
         self.set_standard_fields()
         self.custom_fields = OrderedDict()
@@ -821,7 +922,7 @@ class About(object):
         self.base_dir = None
         if self.location:
             self.base_dir = os.path.dirname(location)
-            self.errors.extend(self.load(location))
+            self.errors.extend(self.load(location, path_index=path_index))
             if strict and self.errors and filter_errors(self.errors):
                 msg = '\n'.join(map(str, self.errors))
                 raise Exception(msg)
@@ -833,15 +934,26 @@ class About(object):
         """
         Equality based on fields and custom_fields., i.e. content.
         """
-        return (isinstance(other, self.__class__)
-                and self.fields == other.fields
-                and self.custom_fields == other.custom_fields)
+        if not (isinstance(other, self.__class__)
+                and self.custom_fields == other.custom_fields):
+            return False
+        # a field that was never created is the same as a new absent field
+        for name in set(self.fields).union(other.fields):
+            field = self.fields[name] if name in self.fields else self.new_field(name)
+            other_field = (other.fields[name] if name in other.fields
+                           else other.new_field(name))
+            if not field == other_field:
+                return False
+        return True
 
     def all_fields(self):
         """
-        Return the list of all Field objects.
+        Return the list of all the created standard Field objects in the
+        standard order followed by the custom Field objects.
         """
-        return list(self.fields.values()) + list(self.custom_fields.values())
+        fields = self.fields
+        return ([fields[name] for name in self.standard_field_names if name in fields]
+                + list(self.custom_fields.values()))
 
     def as_dict(self):
         """
@@ -891,8 +1003,8 @@ class About(object):
             seen_fields[name] = value
 
             # A standard field (could be essential/required or not)
-            standard_field = self.fields.get(name)
-            if standard_field:
+            if name in self.standard_fields_by_name:
+                standard_field = self.get_field(name)
                 standard_field.original_value = value
                 standard_field.value = value
                 standard_field.present = True
@@ -920,19 +1032,16 @@ class About(object):
                 # FIXME: with yaml we could just set whatever is provided
                 custom_field = StringField(name=name, value=value, present=True)
                 self.custom_fields[name] = custom_field
-                # FIXME: why would this ever fail???
-                try:
-                    if name in dir(self):
-                        raise Exception('Illegal field: %(name)r: %(value)r.' % locals())
-                    setattr(self, name, custom_field)
-                except:
+                # a custom field is accessed as an attribute: it cannot
+                # shadow a regular attribute or method
+                if hasattr(type(self), name):
                     msg = 'Internal error with custom field: %(name)r: %(value)r.'
                     errors.append(Error(CRITICAL, msg % locals()))
 
         return errors
 
     def process(self, fields, about_file_path, running_inventory=False,
-                base_dir=None, reference_dir=None):
+                base_dir=None, reference_dir=None, path_index=None):
         """
         Validate and set as attributes on this About object a sequence of
         `fields` name/value tuples. Return a list of errors.
@@ -954,11 +1063,12 @@ class About(object):
             about_file_path,
             running_inventory,
             self.base_dir,
-            self.reference_dir)
+            self.reference_dir,
+            path_index)
         errors.extend(validation_errors)
         return errors
 
-    def load(self, location):
+    def load(self, location, path_index=None):
         """
         Read, parse and process the ABOUT file at `location`.
         Return a list of errors and update self with errors.
@@ -969,16 +1079,17 @@ class About(object):
         errors = []
         try:
             loc = add_unc(loc)
-            with io.open(loc, encoding='utf-8') as txt:
-                input_text = txt.read()
+            if path_index:
+                input_text = path_index.read_text(loc)
+            else:
+                with io.open(loc, encoding='utf-8') as txt:
+                    input_text = txt.read()
             # The 'Yes' and 'No' will be converted to 'True' and 'False' in the yaml.load()
             # Therefore, we need to wrap the original value in quote to prevent
-            # the conversion
-            pre_input = wrap_boolean_value(input_text)
-            # saneyaml.load() will have parsing error if the input has
-            # tab value. Therefore, we should check if the input contains
-            # any tab and then convert it to spaces.
-            input = replace_tab_with_spaces(pre_input)
+            # the conversion.
+            # saneyaml.load() will also have parsing error if the input has
+            # tab value. Therefore, we should convert any tab to spaces.
+            input = prepare_about_text(input_text)
             # FIXME: this should be done in the commands, not here
             """
             The running_inventory defines if the current process is 'inventory' or not.
@@ -991,7 +1102,8 @@ class About(object):
             """
             running_inventory = True
             data = saneyaml.load(input, allow_duplicate_keys=False)
-            errs = self.load_dict(data, base_dir, running_inventory)
+            errs = self.load_dict(
+                data, base_dir, running_inventory, path_index=path_index)
             errors.extend(errs)
         except Exception as e:
             trace = traceback.format_exc()
@@ -1003,7 +1115,8 @@ class About(object):
 
     # FIXME: should be a from_dict class factory instead
     # FIXME: running_inventory: remove this : this should be done in the commands, not here
-    def load_dict(self, fields_dict, base_dir, running_inventory=False, reference_dir=None,):
+    def load_dict(self, fields_dict, base_dir, running_inventory=False,
+                  reference_dir=None, path_index=None):
         """
         Load this About object file from a `fields_dict` name/value dict.
         Return a list of errors.
@@ -1037,6 +1150,7 @@ class About(object):
             running_inventory=running_inventory,
             base_dir=base_dir,
             reference_dir=reference_dir,
+            path_index=path_index,
         )
         self.errors = errors
         return errors
@@ -1185,7 +1299,8 @@ class About(object):
             dumped.write(genereated_tk_version)
             dumped.write(self.dumps(lic_dict))
 
-    def dump_android_notice(self, path, context):
+    @staticmethod
+    def dump_android_notice(path, context):
         """
         Write the NOITCE file consist of copyright, notice and license
         """
@@ -1270,26 +1385,101 @@ class About(object):
         return license_key_name_context_url
 
 
-def collect_inventory(location):
+# a util.PathIndex or ZipIndex shared by the ABOUT files loaded in a worker
+# process
+_worker_path_index = None
+
+
+def init_load_about_worker(path_index=None):
+    """
+    Initialize a multiprocessing pool worker process with its own PathIndex or
+    with a copy of a `path_index` ZipIndex.
+    """
+    global _worker_path_index
+    _worker_path_index = path_index or util.PathIndex()
+
+
+def load_about(location_and_path, path_index=None):
+    """
+    Return an About object loaded from a (`location`, `about_file_path`) tuple.
+    This is a module-level function such that it can be used with a
+    multiprocessing pool.
+    """
+    about_loc, about_file_path = location_and_path
+    path_index = path_index or _worker_path_index
+    return About(about_loc, about_file_path, path_index=path_index)
+
+
+def collect_inventory(location, processes=1, cache=None, ignores=(), path_index=None):
     """
     Collect ABOUT files at location and return a list of errors and a list of
     About objects.
+
+    Use up to `processes` worker processes to load and validate the ABOUT
+    files in parallel. The About objects and errors are always returned in the
+    same order as with a sequential collection.
+
+    If `cache` is an InventoryCache, reuse the About objects cached there for
+    unchanged ABOUT files and cache the other loaded About objects.
+
+    Skip the files and directories matching any of the `ignores` glob patterns.
+
+    If `path_index` is a util.ZipIndex, `location` is a location in its zip
+    archive and the ABOUT files are read from the archive.
     """
     errors = []
     input_location = util.get_absolute(location)
-    about_locations = list(util.get_about_locations(input_location))
+    about_locations = list(
+        util.get_about_locations(input_location, ignores, path_index))
 
     name_errors = util.check_file_names(about_locations)
     errors.extend(name_errors)
     abouts = []
-    for about_loc in about_locations:
-        about_file_path = util.get_relative_path(input_location, about_loc)
-        about = About(about_loc, about_file_path)
-        # Insert about_file_path reference to the error
-        for severity, message in about.errors:
-            msg = (about_file_path + ": " + message)
-            errors.append(Error(severity, msg))
-        abouts.append(about)
+    locations_and_paths = [
+        (about_loc, util.get_relative_path(input_location, about_loc))
+        for about_loc in about_locations]
+
+    cached = {}
+    to_load = locations_and_paths
+    if cache:
+        to_load = []
+        for location_and_path in locations_and_paths:
+            about = cache.get(*location_and_path)
+            if about is None:
+                to_load.append(location_and_path)
+            else:
+                cached[location_and_path] = about
+
+    pool = None
+    if processes and processes > 1 and len(to_load) > 1:
+        pool = multiprocessing.Pool(processes, init_load_about_worker, (path_index,))
+        # use reasonably large chunks to limit the pickling overhead
+        chunksize = max(1, min(64, len(to_load) // (processes * 4)))
+        # imap returns results in the order of the inputs
+        loaded = pool.imap(load_about, to_load, chunksize)
+    else:
+        # the files and directories are listed only once for all ABOUT files
+        loaded = map(partial(
+            load_about, path_index=path_index or util.PathIndex()), to_load)
+    loaded = iter(loaded)
+
+    try:
+        for location_and_path in locations_and_paths:
+            about = cached.get(location_and_path)
+            if about is None:
+                about = next(loaded)
+                if cache:
+                    cache.put(location_and_path[0], location_and_path[1], about)
+            about_file_path = location_and_path[1]
+            # Insert about_file_path reference to the error
+            for severity, message in about.errors:
+                msg = (about_file_path + ": " + message)
+                errors.append(Error(severity, msg))
+            abouts.append(about)
+    finally:
+        if pool:
+            pool.close()
+            pool.join()
     return unique(errors), abouts
 
 
@@ -1298,46 +1488,31 @@ def get_field_names(abouts):
     Given a list of About objects, return a list of any field names that exist
     in any object, including custom fields.
     """
-    fields = []
-    # fields.append(About.ABOUT_FILE_PATH_ATTR)
-
-    standard_fields = About().fields.keys()
-    standards = []
+    standards = set()
+    customs = set()
     for a in abouts:
         for name, field in a.fields.items():
-            if field.required:
-                if name not in standards:
-                    standards.append(name)
-            else:
-                if field.present:
-                    if name not in standards:
-                        standards.append(name)
-    # resort standard fields in standard order
-    # which is a tad complex as this is a predefined order
-    sorted_std = []
-    for fn in standard_fields:
-        if fn in standards:
-            sorted_std.append(fn)
-    fields.extend(sorted_std)
-
-    customs = []
-    for a in abouts:
+            if field.required or field.present:
+                standards.add(name)
         for name, field in a.custom_fields.items():
             if field.has_content:
-                if name not in customs:
-                    customs.append(name)
-    # always sort custom fields list by name
-    customs.sort()
-    fields.extend(customs)
+                customs.add(name)
 
+    # resort standard fields in the predefined standard order
+    fields = [name for name in About.standard_field_names if name in standards]
+    # always sort custom fields list by name
+    fields.extend(sorted(customs))
     return fields
 
 
-def copy_redist_src(copy_list, location, output, with_structure):
+def copy_redist_src(copy_list, location, output, with_structure, copier=None):
     """
-    Given a list of files/directories and copy to the destination
+    Given a list of files/directories and copy to the destination using a
+    `copier` FileCopier. Return a list of errors.
     """
-    errors = []
+    if copier is None:
+        copier = util.FileCopier()
+    entries = []
     for from_path in copy_list:
         norm_from_path = norm(from_path)
         relative_from_path = norm_from_path.partition(util.norm(location))[2]
@@ -1349,13 +1524,11 @@ def copy_redist_src(copy_list, location, output, with_structure):
             output_dir = os.path.dirname(os.path.join(output, util.norm(relative_from_path)))
         else:
             output_dir = output
-        err = copy_file(from_path, output_dir)
-        if err:
-            errors.extend(err)
-    return errors
+        entries.append((from_path, output_dir))
+    return copier.copy(entries)
 
 
-def get_copy_list(abouts, location):
+def get_copy_list(abouts, location, path_index=None):
     """
     Return a list of files/directories that need to be copied (and error if any)
     This is a summary list in a sense that if a directory is already in the list,
@@ -1367,7 +1540,11 @@ def get_copy_list(abouts, location):
     it will prompt warning as the directory that need to be copied is already exist.
     Technically, this is correct, but it leads to confusion. Therefore, we want to
     create a summarized list to avoid this kind of confusion.
+
+    Use the optional `path_index` util.PathIndex or ZipIndex to access the files.
     """
+    if path_index is None:
+        path_index = util.PathIndex()
     errors = []
     copy_list = []
     dir_list = []
@@ -1390,25 +1567,8 @@ def get_copy_list(abouts, location):
                         norm_from_path = os.path.normpath(from_path)
                     # Get the relative path
                     relative_from_path = norm_from_path.partition(util.norm(location))[2]
-                    if os.path.isdir(from_path):
-                        if not dir_list:
-                            dir_list.append(relative_from_path)
-                        else:
-                            handled = False
-                            for dir in dir_list:
-                                # The dir is a parent of the relative_from_path
-                                if dir in relative_from_path:
-                                    handled = True
-                                    continue
-                                # The relative_from_path is the parent of the dir
-                                # We need to update the dir_list
-                                if relative_from_path in dir:
-                                    dir_list.remove(dir)
-                                    dir_list.append(relative_from_path)
-                                    handled = True
-                                    continue
-                            if not handled:
-                                dir_list.append(relative_from_path)
+                    if path_index.isdir(from_path):
+                        dir_list.append(relative_from_path)
                     else:
                         # Check if the file is from "root"
                         # If the file is at root level, it'll add to the copy_list
@@ -1417,23 +1577,21 @@ def get_copy_list(abouts, location):
                         else:
                             copy_list.append(from_path)
 
+    # Summarize the list: the directories and files that are in one of the
+    # copied directories are copied with it
+    copied_dirs = util.PathTrie()
     for dir in dir_list:
-        for f in file_list:
-            # The file is already in one of copied directories
-            if dir in f:
-                file_list.remove(f)
-                continue
-        if dir.startswith('/'):
-            dir = dir.partition('/')[2]
-        absolute_path = os.path.join(location, dir)
-        if on_windows:
-            absolute_path = add_unc(absolute_path)
-        copy_list.append(absolute_path)
+        copied_dirs.add(dir)
+
+    summarized = [dir for dir in unique(dir_list)
+                  if not copied_dirs.has_ancestor(dir, strict=True)]
+    summarized.extend(f for f in unique(file_list)
+                      if not copied_dirs.has_ancestor(f))
 
-    for f in file_list:
-        if f.startswith('/'):
-            f = f.partition('/')[2]
-        absolute_path = os.path.join(location, f)
+    for path in summarized:
+        if path.startswith('/'):
+            path = path.partition('/')[2]
+        absolute_path = os.path.join(location, path)
         if on_windows:
             absolute_path = add_unc(absolute_path)
         copy_list.append(absolute_path)
@@ -1444,49 +1602,68 @@ def about_object_to_list_of_dictionary(abouts):
     """
     Convert About objects to a list of dictionaries
     """
-    serialized = []
+    return list(iter_about_dictionaries(abouts))
+
+
+def iter_about_dictionaries(abouts):
+    """
+    Yield a dictionary for each About object of an `abouts` iterable, skipping
+    the About objects without an about_resource.
+    """
     for about in abouts:
-        # Restore the *_file value to the original value
-        # The *_file's original_value may be parsed (i.e. split(',))
-        # for validation purpose.  
-        about.license_file.value = about.license_file.original_value
-        about.notice_file.value = about.notice_file.original_value 
-        about.changelog_file.value = about.changelog_file.original_value
-        about.author_file.value = about.author_file.original_value
-
-        # TODO: this wholeblock should be under sd_dict()
-        ad = about.as_dict()
-
-        # Update the 'about_resource' field with the relative path
-        # from the output location
-        try:
-            if ad['about_resource']:
-                if 'about_file_path' in ad.keys():
-                    afp = ad['about_file_path']
-                    afp_parent = posixpath.dirname(afp)
-                    afp_parent = '/' + afp_parent if not afp_parent.startswith('/') else afp_parent
-                    about_resource = ad['about_resource']
-                    for resource in about_resource:
-                        updated_about_resource = posixpath.normpath(posixpath.join(afp_parent, resource))
-                        if resource == u'.':
-                            if not updated_about_resource == '/': 
-                                updated_about_resource = updated_about_resource + '/'
-                    ad['about_resource'] = OrderedDict([(updated_about_resource, None)])
-                    del ad['about_file_path']
-                serialized.append(ad)
-        except Exception as e:
-            # The missing required field, about_resource, has already been checked
-            # and the error has already been logged.
-            pass
-    return serialized
+        ad = about_object_to_dictionary(about)
+        if ad is not None:
+            yield ad
+
+
+def about_object_to_dictionary(about):
+    """
+    Return a dictionary converted from an `about` About object or None if it
+    has no about_resource.
+    """
+    # Restore the *_file value to the original value
+    # The *_file's original_value may be parsed (i.e. split(',))
+    # for validation purpose.  
+    about.license_file.value = about.license_file.original_value
+    about.notice_file.value = about.notice_file.original_value 
+    about.changelog_file.value = about.changelog_file.original_value
+    about.author_file.value = about.author_file.original_value
+
+    # TODO: this wholeblock should be under sd_dict()
+    ad = about.as_dict()
+
+    # Update the 'about_resource' field with the relative path
+    # from the output location
+    try:
+        if ad['about_resource']:
+            if 'about_file_path' in ad.keys():
+                afp = ad['about_file_path']
+                afp_parent = posixpath.dirname(afp)
+                afp_parent = '/' + afp_parent if not afp_parent.startswith('/') else afp_parent
+                about_resource = ad['about_resource']
+                for resource in about_resource:
+                    updated_about_resource = posixpath.normpath(posixpath.join(afp_parent, resource))
+                    if resource == u'.':
+                        if not updated_about_resource == '/': 
+                            updated_about_resource = updated_about_resource + '/'
+                ad['about_resource'] = OrderedDict([(updated_about_resource, None)])
+                del ad['about_file_path']
+            return ad
+    except Exception as e:
+        # The missing required field, about_resource, has already been checked
+        # and the error has already been logged.
+        pass
 
 
 def write_output(abouts, location, format):  # NOQA
     """
     Write a CSV/JSON file at location given a list of About objects.
     Return a list of Error objects.
+
+    The About objects are converted and written one at a time such that the
+    whole output is never built in memory.
     """
-    about_dicts = about_object_to_list_of_dictionary(abouts)
+    about_dicts = iter_about_dictionaries(abouts)
     location = add_unc(location)
     if format == 'csv':
         errors = save_as_csv(location, about_dicts, get_field_names(abouts))
@@ -1496,12 +1673,25 @@ def write_output(abouts, location, format):  # NOQA
 
 
 def save_as_json(location, about_dicts):
+    """
+    Write an `about_dicts` iterable of About data dictionaries as a JSON array
+    at `location`, encoding one item at a time. The output is the same as
+    json.dumps(list(about_dicts), indent=2).
+    """
     mode = 'w'
+    # the items separator used by json.dumps with an indent
+    separator = ','
     if python2:
         mode = 'wb'
+        separator = ', '
     with io.open(location, mode=mode) as output_file:
-        data = util.format_about_dict_for_json_output(about_dicts)
-        output_file.write(json.dumps(data, indent=2))
+        start = '[\n  '
+        for about_dict in about_dicts:
+            data = util.format_about_dict_for_json_row(about_dict)
+            output_file.write(start)
+            output_file.write(json.dumps(data, indent=2).replace('\n', '\n  '))
+            start = separator + '\n  '
+        output_file.write('[]' if start == '[\n  ' else '\n]')
     return []
 
 
@@ -1510,8 +1700,8 @@ def save_as_csv(location, about_dicts, field_names):
     with io.open(location, mode='w', encoding='utf-8', newline='') as output_file:
         writer = csv.DictWriter(output_file, field_names)
         writer.writeheader()
-        csv_formatted_list = util.format_about_dict_for_csv_output(about_dicts)
-        for row in csv_formatted_list:
+        for about_dict in about_dicts:
+            row = util.format_about_dict_for_csv_row(about_dict)
             # See https://github.com/dejacode/about-code-tool/issues/167
             try:
                 writer.writerow(row)
@@ -1521,30 +1711,29 @@ def save_as_csv(location, about_dicts, field_names):
     return errors
 
 
-def pre_process_and_fetch_license_dict(abouts, api_url, api_key):
+def pre_process_and_fetch_license_dict(abouts, api_url, api_key,
+                                       license_cache=None, offline=False,
+                                       timeout=10):
     """
     Modify a list of About data dictionaries by adding license information
     fetched from the DejaCode API.
+
+    If `license_cache` is a LicenseCache, use the fresh license data cached
+    there and cache the fetched license data. Stale cached license data are
+    used if they cannot be fetched again. If `offline` is True, use only the
+    cached license data, even if stale, and never access the network.
+    Give up fetching licenses if the API cannot be reached within `timeout`
+    seconds.
     """
     dje_uri = urlparse(api_url)
     domain = '{uri.scheme}://{uri.netloc}/'.format(uri=dje_uri)
     dje_lic_urn = urljoin(domain, 'urn/?urn=urn:dje:license:')
     key_text_dict = {}
-    captured_license = []
     errors = []
-    if util.have_network_connection():
-        if not valid_api_url(api_url):
-            msg = u"URL not reachable. Invalid '--api_url'. License generation is skipped."
-            errors.append(Error(ERROR, msg))
-    else:
-        msg = u'Network problem. Please check your Internet connection. License generation is skipped.'
-        errors.append(Error(ERROR, msg))
+
+    # collect the unique license keys first to fetch them all at once
+    license_keys = []
     for about in abouts:
-        # No need to go through all the about objects for license extraction if we detected
-        # invalid '--api_key'
-        auth_error = Error(ERROR, u"Authorization denied. Invalid '--api_key'. License generation is skipped.")
-        if auth_error in errors:
-            break
         if about.license_expression.present:
             special_char_in_expression, lic_list = parse_license_expression(about.license_expression.value)
             if special_char_in_expression:
@@ -1552,31 +1741,118 @@ def pre_process_and_fetch_license_dict(abouts, api_url, api_key):
                        str(special_char_in_expression))
                 errors.append(Error(ERROR, msg))
             else:
-                for lic_key in lic_list:
-                    if not lic_key in captured_license:
-                        detail_list = []
-                        license_name, license_key, license_text, errs = api.get_license_details_from_api(api_url, api_key, lic_key)
-                        for e in errs:
-                            if e not in errors:
-                                errors.append(e)
-                        if license_key:
-                            captured_license.append(lic_key)
-                            dje_lic_url = dje_lic_urn + license_key
-                            detail_list.append(license_name)
-                            detail_list.append(license_text)
-                            detail_list.append(dje_lic_url)
-                            key_text_dict[license_key] = detail_list
-    return key_text_dict, errors
+                license_keys.extend(lic_list)
+    license_keys = unique(license_keys)
+
+    licenses = {}
+    # {license key: stale cached license data} used if a refetch fails
+    stale_licenses = {}
+    to_fetch = license_keys
+    if license_cache:
+        to_fetch = []
+        for lic_key in license_keys:
+            license_data = license_cache.get(api_url, lic_key, allow_stale=offline)
+            if license_data:
+                licenses[lic_key] = license_data
+                continue
+            to_fetch.append(lic_key)
+            if not offline:
+                license_data = license_cache.get(api_url, lic_key, allow_stale=True)
+                if license_data:
+                    stale_licenses[lic_key] = license_data
+
+    if offline:
+        for lic_key in to_fetch:
+            msg = u"License %(lic_key)s is not available in the license cache." % locals()
+            errors.append(Error(ERROR, msg))
+    elif to_fetch:
+        fetcher = api.LicenseFetcher(api_url, api_key, timeout=timeout)
+        fetched, errs = fetcher.fetch(to_fetch)
+        errors.extend(errs)
+        for lic_key, license_data in fetched.items():
+            licenses[lic_key] = license_data
+            if license_cache:
+                license_cache.put(api_url, lic_key, license_data)
+        for lic_key in to_fetch:
+            # a stale license is better than none when the API failed, but not
+            # when the API reported that the license no longer exists
+            if (lic_key in stale_licenses and lic_key not in fetched
+                    and lic_key not in fetcher.invalid_keys):
+                licenses[lic_key] = stale_licenses[lic_key]
+
+    for lic_key in license_keys:
+        license_data = licenses.get(lic_key)
+        if not license_data:
+            continue
+        license_key = license_data.get('key', '')
+        if license_key:
+            dje_lic_url = dje_lic_urn + license_key
+            key_text_dict[license_key] = [
+                license_data.get('name', ''),
+                license_data.get('full_text', ''),
+                dje_lic_url,
+            ]
+    return key_text_dict, unique(errors)
+
+
+class LicenseExpressionParser(object):
+    """
+    Parse license expressions with a single Licensing, optionally seeded with
+    a `known_keys` list of license keys, and remember the results for the
+    `max_size` most recently parsed expressions. A parser can be shared by
+    threads.
+    """
+
+    def __init__(self, max_size=10000, known_keys=()):
+        self.licensing = Licensing(known_keys)
+        self.max_size = max_size
+        # {expression: (special characters, license keys)} in least recently
+        # used first order
+        self.parsed = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        # guards the parsed expressions and the counters
+        self.lock = threading.Lock()
+
+    def parse(self, lic_expression):
+        """
+        Return a tuple of (list of unsupported special characters, list of
+        license keys) for a `lic_expression` license expression string. The
+        list of keys is empty if there are special characters.
+        """
+        with self.lock:
+            parsed = self.parsed.pop(lic_expression, None)
+            if parsed is not None:
+                self.hits += 1
+                # reinsert last as the most recently used
+                self.parsed[lic_expression] = parsed
+
+        if parsed is None:
+            # parse outside of the lock such that other threads are not blocked
+            lic_list = []
+            special_char = detect_special_char(lic_expression)
+            if not special_char:
+                # Parse the license expression and save it into a list
+                lic_list = self.licensing.license_keys(lic_expression)
+            parsed = special_char, lic_list
+            with self.lock:
+                self.misses += 1
+                # another thread may have parsed the same expression meanwhile
+                self.parsed.pop(lic_expression, None)
+                self.parsed[lic_expression] = parsed
+                while len(self.parsed) > self.max_size:
+                    self.parsed.popitem(last=False)
+
+        special_char, lic_list = parsed
+        # return copies as callers may modify these lists
+        return list(special_char), list(lic_list)
+
+
+license_expression_parser = LicenseExpressionParser()
 
 
 def parse_license_expression(lic_expression):
-    licensing = Licensing()
-    lic_list = []
-    special_char = detect_special_char(lic_expression)
-    if not special_char:
-        # Parse the license expression and save it into a list
-        lic_list = licensing.license_keys(lic_expression)
-    return special_char, lic_list
+    return license_expression_parser.parse(lic_expression)
 
 
 def detect_special_char(expression):
@@ -1588,20 +1864,3 @@ def detect_special_char(expression):
         if char in expression:
             special_character.append(char)
     return special_character
-
-
-def valid_api_url(api_url):
-    try:
-        request = Request(api_url)
-        # This will always goes to exception as no key are provided.
-        # The purpose of this code is to validate the provided api_url is correct
-        urlopen(request)
-    except HTTPError as http_e:
-        # The 403 error code is refer to "Authentication credentials were not provided.".
-        # This is correct as no key are provided.
-        if http_e.code == 403:
-            return True
-    except:
-        # All other exceptions yield to invalid api_url
-        pass
-    return False
@@ -242,9 +242,8 @@ class Transformer(object):
     # called by attr after the __init__()
     def __attrs_post_init__(self, *args, **kwargs):
         from attributecode.model import About
-        about = About()
-        self.essential_fields = list(about.required_fields)
-        self.standard_fields = [f.name for f in about.all_fields()]
+        self.essential_fields = list(About.required_fields)
+        self.standard_fields = list(About.standard_field_names)
 
     @classmethod
     def default(cls):
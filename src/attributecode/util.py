@@ -19,7 +19,10 @@ from __future__ import unicode_literals
 
 import codecs
 from collections import OrderedDict
+import fnmatch
+import io
 import json
+from multiprocessing.pool import ThreadPool
 import ntpath
 import os
 import posixpath
@@ -27,8 +30,9 @@ import re
 import shutil
 import string
 import sys
-
-from distutils.dir_util import copy_tree
+import threading
+import time
+import zipfile
 
 from attributecode import CRITICAL
 from attributecode import WARNING
@@ -53,6 +57,12 @@ else:  # pragma: nocover
 
 on_windows = 'win32' in sys.platform
 
+try:
+    from os import scandir  # NOQA
+except ImportError:  # pragma: nocover
+    # Python 2
+    scandir = None
+
 # boolean field name
 boolean_fields = ['redistribute', 'attribute', 'track_change', 'modified', 'internal_use_only']
 file_fields = ['about_resource', 'notice_file', 'changelog_file', 'author_file']
@@ -128,29 +138,41 @@ def check_file_names(paths):
             seen[path] = orig_path
     return errors
 
+def wrap_boolean_line(line):
+    """
+    Return a `line` with its value wrapped in quotes if this is a boolean
+    field line.
+    """
+    key, _, value = line.partition(':')
+    if key in boolean_fields:
+        return key + ': "' + value.strip() + '"'
+    return line
+
+
 def wrap_boolean_value(context):
-    updated_context = ''
-    for line in context.splitlines():
-        """
-        wrap the boolean value in quote
-        """
-        key = line.partition(':')[0]
-        value = line.partition(':')[2].strip()
-        value = '"' + value + '"'
-        if key in boolean_fields and not value == "":
-            updated_context += key + ': ' + value + '\n'
-        else:
-            updated_context += line + '\n'
-    return updated_context
+    """
+    Return a `context` text where the value of each boolean field is wrapped in
+    quotes.
+    """
+    return ''.join(wrap_boolean_line(line) + '\n' for line in context.splitlines())
+
 
 def replace_tab_with_spaces(context):
-    updated_context = ''
-    for line in context.splitlines():
-        """
-        Replace tab with 4 spaces
-        """
-        updated_context += line.replace('\t', '    ') + '\n'
-    return updated_context
+    """
+    Return a `context` text where tabs are replaced with 4 spaces.
+    """
+    return ''.join(line.replace('\t', '    ') + '\n' for line in context.splitlines())
+
+
+def prepare_about_text(context):
+    """
+    Return an ABOUT file `context` text ready for YAML parsing in a single
+    pass: the values of the boolean fields are wrapped in quotes and the tabs
+    are replaced with 4 spaces.
+    This is the same as replace_tab_with_spaces(wrap_boolean_value(context)).
+    """
+    return ''.join(wrap_boolean_line(line).replace('\t', '    ') + '\n'
+                   for line in context.splitlines())
 
 # TODO: rename to normalize_path
 def get_absolute(location):
@@ -164,32 +186,69 @@ def get_absolute(location):
     return location
 
 
-def get_locations(location):
+def is_ignored(name, path, ignores):
+    """
+    Return True if a file or directory with a `name` and a posix `path`
+    relative to the root of a walk matches any of the `ignores` sequence of
+    glob patterns.
+    For example:
+    >>> is_ignored('.git', 'src/.git', ['.git'])
+    True
+    >>> is_ignored('foo', 'build/foo', ['build/*'])
+    True
+    >>> is_ignored('foo.c', 'src/foo.c', ['*.h'])
+    False
+    """
+    return any(fnmatch.fnmatchcase(name, pattern)
+               or fnmatch.fnmatchcase(path, pattern)
+               for pattern in ignores)
+
+
+def get_locations(location, ignores=(), path_index=None):
     """
     Return a list of locations of files given the `location` of a
     a file or a directory tree containing ABOUT files.
     File locations are normalized using posix path separators.
+
+    Skip the files and directories that match any of the `ignores` glob
+    patterns. Ignored directories are not walked.
+
+    Use the optional `path_index` PathIndex or ZipIndex to access the files.
     """
     location = add_unc(location)
     location = get_absolute(location)
-    assert os.path.exists(location)
+    if path_index is None:
+        path_index = PathIndex()
+    assert path_index.exists(location)
 
-    if os.path.isfile(location):
+    if not path_index.isdir(location):
         yield location
     else:
-        for base_dir, _, files in os.walk(location):
+        for base_dir, dirs, files in path_index.walk(location):
+            bd = to_posix(base_dir)
+            if ignores:
+                rel_dir = to_posix(os.path.relpath(base_dir, location))
+                rel_dir = '' if rel_dir == '.' else rel_dir
+                # prune ignored directories in place such that the walk does
+                # not descend into them
+                dirs[:] = [d for d in dirs
+                    if not is_ignored(d, posixpath.join(rel_dir, d), ignores)]
+                files = [f for f in files
+                    if not is_ignored(f, posixpath.join(rel_dir, f), ignores)]
             for name in files:
-                bd = to_posix(base_dir)
                 yield posixpath.join(bd, name)
 
 
-def get_about_locations(location):
+def get_about_locations(location, ignores=(), path_index=None):
     """
     Return a list of locations of ABOUT files given the `location` of a
     a file or a directory tree containing ABOUT files.
     File locations are normalized using posix path separators.
+
+    Skip the files and directories that match any of the `ignores` glob
+    patterns. Use the optional `path_index` to access the files.
     """
-    for loc in get_locations(location):
+    for loc in get_locations(location, ignores, path_index):
         if is_about_file(loc):
             yield loc
 
@@ -275,17 +334,22 @@ def load_csv(location):
     Read CSV at `location`, return a list of ordered dictionaries, one
     for each row.
     """
-    results = []
     # FIXME: why ignore encoding errors here?
     with codecs.open(location, mode='rb', encoding='utf-8-sig',
                      errors='ignore') as csvfile:
-        for row in csv.DictReader(csvfile):
-            # convert all the column keys to lower case
-            updated_row = OrderedDict(
-                [(key.lower(), value) for key, value in row.items()]
-            )
-            results.append(updated_row)
-    return results
+        return list(iter_csv_rows(csv.DictReader(csvfile)))
+
+
+def iter_csv_rows(reader):
+    """
+    Yield ordered dictionaries, one for each row read lazily from a CSV
+    `reader` DictReader, with lower case column names.
+    """
+    for row in reader:
+        # convert all the column keys to lower case
+        yield OrderedDict(
+            [(key.lower(), value) for key, value in row.items()]
+        )
 
 
 def load_json(location):
@@ -353,32 +417,12 @@ def load_json(location):
     return results
 
 
-# FIXME: rename to is_online: BUT do we really need this at all????
-def have_network_connection():
-    """
-    Return True if an HTTP connection to some public web site is possible.
-    """
-    import socket
-    if python2:
-        import httplib  # NOQA
-    else:
-        import http.client as httplib  # NOQA
-
-    http_connection = httplib.HTTPConnection('dejacode.org', timeout=10)  # NOQA
-    try:
-        http_connection.connect()
-    except socket.error:
-        return False
-    else:
-        return True
-
-
 def extract_zip(location):
     """
     Extract a zip file at location in a temp directory and return the temporary
-    directory where the archive was extracted.
+    directory where the archive was extracted. The caller is responsible for
+    deleting this directory. Use a ZipIndex to read a zip without extracting it.
     """
-    import zipfile
     import tempfile
 
     if not zipfile.is_zipfile(location):
@@ -395,24 +439,26 @@ def extract_zip(location):
 
     with zipfile.ZipFile(location) as zipf:
         for info in zipf.infolist():
-            name = info.filename
-            content = zipf.read(name)
+            name = posixpath.normpath(to_posix(info.filename)).strip('/')
+            if not name or name == '.' or name == '..' or name.startswith('../'):
+                # never extract outside of the target directory
+                continue
             target = os.path.join(target_dir, name)
-            is_dir = target.endswith((ntpath.sep, posixpath.sep))
-            if is_dir:
-                target = target[:-1]
+            is_dir = info.filename.endswith('/')
             parent = os.path.dirname(target)
             if on_windows:
                 target = target.replace(posixpath.sep, ntpath.sep)
                 parent = parent.replace(posixpath.sep, ntpath.sep)
             if not os.path.exists(parent):
                 os.makedirs(add_unc(parent))
-            if not content and is_dir:
+            if is_dir:
                 if not os.path.exists(target):
                     os.makedirs(add_unc(target))
-            if not os.path.exists(target):
-                with open(target, 'wb') as f:
-                    f.write(content)
+            elif not os.path.exists(target):
+                # stream the content rather than reading it all in memory
+                with zipf.open(info) as inp:
+                    with open(target, 'wb') as f:
+                        shutil.copyfileobj(inp, f)
     return target_dir
 
 
@@ -479,51 +525,352 @@ def copy_license_notice_files(fields, base_dir, reference_dir, afp):
     return errors
 
 
-def copy_file(from_path, to_path):
-    error = ''
+def copy_file(from_path, to_path, copier=None):
+    """
+    Copy the file or directory at `from_path` in the `to_path` directory using
+    a `copier` FileCopier. Return an Error or an empty string.
+    """
     # Return if the from_path is empty or None.
     if not from_path:
         return
+    if copier is None:
+        copier = FileCopier()
+    errors = copier.copy([(from_path, to_path)])
+    if errors:
+        return errors[0]
+    return ''
+
+
+def get_stat(location):
+    """
+    Return the os.stat result for `location` or None if it does not exist.
+    """
+    try:
+        return os.stat(location)
+    except OSError:
+        return None
 
-    if on_windows:
-        if not from_path.startswith(UNC_PREFIXES):
-            from_path = add_unc(from_path)
+
+class FileCopier(object):
+    """
+    Copy files and directories with a pool of up to `workers` threads.
+
+    A file is not copied if the target file already exists with the same size
+    and modification time. If `link` is True, files are hard linked rather
+    than copied when the source and the target are on the same filesystem: the
+    linked files share their content with the source files.
+
+    If `source` is a ZipIndex, the files of its zip archive are extracted
+    rather than copied.
+
+    The number of files and bytes copied and the time spent copying are
+    accumulated across calls to `copy()`.
+    """
+
+    COPIED = 'copied'
+    LINKED = 'linked'
+    SKIPPED = 'skipped'
+
+    def __init__(self, workers=1, link=False, source=None):
+        self.workers = workers
+        self.link = link
+        self.source = source
+        self.counts = {self.COPIED: 0, self.LINKED: 0, self.SKIPPED: 0}
+        self.bytes_count = 0
+        self.elapsed = 0
+
+    def get_target(self, to_path):
+        """
+        Return a `to_path` target path usable on Windows.
+        """
         if not to_path.startswith(UNC_PREFIXES):
             to_path = add_unc(to_path)
+        return to_path
 
-    # Strip the white spaces
-    from_path = from_path.strip()
-    to_path = to_path.strip()
-    # Errors will be captured when doing the validation
-    if not os.path.exists(from_path):
-        return ''
+    def exists(self, to_path):
+        """
+        Return True if the `to_path` target file or directory exists.
+        """
+        return os.path.exists(to_path)
 
-    if not posixpath.exists(to_path):
+    def makedirs(self, to_path):
+        """
+        Create the `to_path` target directory and its parents.
+        """
         os.makedirs(to_path)
-    try:
-        if os.path.isdir(from_path):
+
+    def get_tasks(self, from_path, to_path, tasks):
+        """
+        Add to the `tasks` mapping of {target: source} the files to copy from
+        the file or directory at `from_path` in the `to_path` directory.
+        Create the target directories. Return an Error or None.
+        """
+        if on_windows:
+            if not from_path.startswith(UNC_PREFIXES):
+                from_path = add_unc(from_path)
+            to_path = self.get_target(to_path)
+
+        # Strip the white spaces
+        from_path = from_path.strip()
+        to_path = to_path.strip()
+        source = self.source or PathIndex()
+        # Errors will be captured when doing the validation
+        if not source.exists(from_path):
+            return
+
+        error = None
+        if not self.exists(to_path):
+            self.makedirs(to_path)
+        if source.isdir(from_path):
             # Copy the whole directory structure
             if from_path.endswith('/'):
                 from_path = from_path.rpartition('/')[0]
             folder_name = os.path.basename(from_path)
             to_path = os.path.join(to_path, folder_name)
-            if os.path.exists(to_path):
+            if self.exists(to_path):
                 msg = to_path + ' is already existed and is replaced by ' + from_path
                 error = Error(WARNING, msg)
-            copy_tree(from_path, to_path)
+            for top, _dirs, files in source.walk(from_path, followlinks=True):
+                to_dir = os.path.normpath(
+                    os.path.join(to_path, os.path.relpath(top, from_path)))
+                if not self.exists(to_dir):
+                    self.makedirs(to_dir)
+                for name in files:
+                    tasks[os.path.join(to_dir, name)] = os.path.join(top, name)
         else:
             file_name = os.path.basename(from_path)
             to_file_path = os.path.join(to_path, file_name)
-            if os.path.exists(to_file_path):
+            if self.exists(to_file_path) or to_file_path in tasks:
                 msg = to_file_path + ' is already existed and is replaced by ' + from_path
                 error = Error(WARNING, msg)
-            shutil.copy2(from_path, to_path)
-        return error
-    except Exception as e:
-        msg = 'Cannot copy file at %(from_path)r.' % locals()
-        error = Error(CRITICAL, msg)
+            tasks[to_file_path] = from_path
         return error
 
+    def copy_one(self, task):
+        """
+        Copy a file given a `task` tuple of (target, source) paths. Return a
+        tuple of (status, size, error).
+        """
+        to_path, from_path = task
+        if self.in_source(from_path):
+            return self.extract_one(task)
+        try:
+            from_stat = os.stat(from_path)
+            to_stat = get_stat(to_path)
+
+            if to_stat:
+                same_file = (from_stat.st_ino == to_stat.st_ino
+                             and from_stat.st_dev == to_stat.st_dev)
+                unchanged = (from_stat.st_size == to_stat.st_size
+                             and abs(from_stat.st_mtime - to_stat.st_mtime) < 1)
+                if same_file or unchanged:
+                    return self.SKIPPED, 0, None
+
+            if self.link:
+                try:
+                    if to_stat:
+                        os.remove(to_path)
+                    os.link(from_path, to_path)
+                    return self.LINKED, from_stat.st_size, None
+                except (AttributeError, OSError):
+                    # hard links are not supported on this platform or across
+                    # filesystems: copy instead
+                    pass
+
+            shutil.copy2(from_path, to_path)
+            return self.COPIED, from_stat.st_size, None
+        except (IOError, OSError, shutil.Error):
+            msg = 'Cannot copy file at %(from_path)r.' % locals()
+            return None, 0, Error(CRITICAL, msg)
+
+    def in_source(self, from_path):
+        """
+        Return True if `from_path` is a file of the `source` zip archive.
+        """
+        return self.source is not None and self.source.get_name(from_path) is not None
+
+    def extract_one(self, task):
+        """
+        Extract a file from the `source` zip archive given a `task` tuple of
+        (target, source) paths. Return a tuple of (status, size, error).
+        """
+        to_path, from_path = task
+        try:
+            size = self.source.getsize(from_path)
+            to_stat = get_stat(to_path)
+            if (to_stat and size == to_stat.st_size
+                    and abs(self.source.getmtime(from_path) - to_stat.st_mtime) < 1):
+                return self.SKIPPED, 0, None
+            self.source.extract(from_path, to_path)
+            return self.COPIED, size, None
+        except (IOError, OSError, zipfile.BadZipfile):
+            msg = 'Cannot copy file at %(from_path)r.' % locals()
+            return None, 0, Error(CRITICAL, msg)
+
+    def copy(self, entries):
+        """
+        Copy each file or directory in a list of (from_path, to_path)
+        `entries` in its `to_path` directory. Return a list of errors.
+        """
+        start = time.time()
+        errors = []
+        # keep only the last source copied to a given target
+        tasks = OrderedDict()
+        for from_path, to_path in entries:
+            if not from_path:
+                continue
+            try:
+                error = self.get_tasks(from_path, to_path, tasks)
+            except (IOError, OSError):
+                msg = 'Cannot copy file at %(from_path)r.' % locals()
+                error = Error(CRITICAL, msg)
+            if error:
+                errors.append(error)
+
+        tasks = list(tasks.items())
+        if self.workers > 1 and len(tasks) > 1:
+            pool = ThreadPool(self.workers)
+            try:
+                results = list(pool.imap(self.copy_one, tasks))
+            finally:
+                pool.close()
+                pool.join()
+        else:
+            results = [self.copy_one(task) for task in tasks]
+
+        for status, size, error in results:
+            if error:
+                errors.append(error)
+            else:
+                self.counts[status] += 1
+                self.bytes_count += size
+        self.elapsed += time.time() - start
+        return errors
+
+    def get_summary(self):
+        """
+        Return a summary message of the files copied so far with the
+        throughput in files and bytes per second.
+        """
+        copied = self.counts[self.COPIED] + self.counts[self.LINKED]
+        megabytes = self.bytes_count / (1024.0 * 1024.0)
+        elapsed = max(self.elapsed, 0.001)
+        msg = ('Copied {copied} files ({megabytes:.1f} MB) in {elapsed:.2f}s: '
+               '{files_rate:.1f} files/s, {bytes_rate:.1f} MB/s.').format(
+            copied=copied, megabytes=megabytes, elapsed=self.elapsed,
+            files_rate=copied / elapsed, bytes_rate=megabytes / elapsed)
+        if self.counts[self.LINKED]:
+            msg += ' {} files were hard linked.'.format(self.counts[self.LINKED])
+        if self.counts[self.SKIPPED]:
+            msg += ' {} unchanged files were skipped.'.format(self.counts[self.SKIPPED])
+        return msg
+
+
+def set_compression_level(info, compression_level):
+    """
+    Set the `compression_level` of a zipfile.ZipInfo `info` of a member
+    written with ZipFile.open().
+
+    ZipFile.open() takes no compression level: it uses the level of the
+    ZipInfo, a public attribute since Python 3.13 and a private one from
+    Python 3.7 to 3.12. Older versions have no level and always compress at
+    the default zlib level.
+    """
+    if sys.version_info >= (3, 13):
+        info.compress_level = compression_level
+    elif sys.version_info >= (3, 7):
+        info._compresslevel = compression_level
+
+
+class ZipCopier(FileCopier):
+    """
+    Copy files and directories in a new zip archive at `location` rather than
+    in a directory: the target paths are the paths of the archive members.
+
+    The files are read and compressed in chunks at a `compression_level` from
+    0 (no compression) to 9. The archive must be closed with `close()`.
+
+    The compression level requires Python 3.7 or later: older versions always
+    compress at the default zlib level.
+    """
+
+    def __init__(self, location, compression_level=6, source=None):
+        FileCopier.__init__(self, workers=1, source=source)
+        self.compression_level = compression_level
+        compression = zipfile.ZIP_DEFLATED
+        if not compression_level:
+            compression = zipfile.ZIP_STORED
+        kwargs = {}
+        if sys.version_info >= (3, 7):
+            kwargs['compresslevel'] = compression_level
+        self.zip_file = zipfile.ZipFile(
+            location, 'w', compression=compression, allowZip64=True, **kwargs)
+        self.names = set()
+
+    @staticmethod
+    def get_name(to_path):
+        """
+        Return the archive member name of a `to_path` target path.
+        """
+        return to_posix(os.path.normpath(to_path)).strip('/')
+
+    def get_target(self, to_path):
+        return to_path
+
+    def exists(self, to_path):
+        name = self.get_name(to_path)
+        return name in ('', '.') or name in self.names
+
+    def makedirs(self, to_path):
+        name = self.get_name(to_path)
+        if self.exists(to_path):
+            return
+        self.makedirs(posixpath.dirname(name))
+        self.names.add(name)
+        info = zipfile.ZipInfo(name + '/', date_time=time.localtime()[:6])
+        # a directory with rwxr-xr-x permissions and the MS-DOS directory flag
+        info.external_attr = (0o40755 << 16) | 0x10
+        self.zip_file.writestr(info, b'')
+
+    def copy_one(self, task):
+        to_path, from_path = task
+        name = self.get_name(to_path)
+        try:
+            if self.in_source(from_path):
+                size = self.source.getsize(from_path)
+                self.write_from_source(from_path, name)
+            else:
+                size = os.path.getsize(from_path)
+                self.zip_file.write(from_path, name)
+            self.names.add(name)
+            return self.COPIED, size, None
+        except (IOError, OSError, zipfile.BadZipfile, zipfile.LargeZipFile):
+            msg = 'Cannot copy file at %(from_path)r.' % locals()
+            return None, 0, Error(CRITICAL, msg)
+
+    def write_from_source(self, from_path, name):
+        """
+        Write the file at `from_path` in the `source` zip archive as the `name`
+        member of this archive.
+        """
+        date_time = self.source.get_info(from_path).date_time
+        info = zipfile.ZipInfo(name, date_time=date_time)
+        info.compress_type = self.zip_file.compression
+        with self.source.open(from_path) as inp:
+            if sys.version_info < (3, 6):
+                # writing a member from a stream is not supported
+                self.zip_file.writestr(info, inp.read())
+                return
+            set_compression_level(info, self.compression_level)
+            with self.zip_file.open(info, 'w', force_zip64=True) as out:
+                shutil.copyfileobj(inp, out)
+
+    def close(self):
+        """
+        Write the end of the archive and close it.
+        """
+        self.zip_file.close()
+
 
 # FIXME: we should use a license object instead
 def ungroup_licenses(licenses):
@@ -548,68 +895,499 @@ def ungroup_licenses(licenses):
 
 # FIXME: add docstring
 def format_about_dict_for_csv_output(about_dictionary_list):
-    csv_formatted_list = []
-    for element in about_dictionary_list:
-        row_list = OrderedDict()
-        for key in element:
-            if element[key]:
-                if isinstance(element[key], list):
-                    row_list[key] = u'\n'.join((element[key]))
-                elif key == u'about_resource':
-                    row_list[key] = u'\n'.join((element[key].keys()))
-                else:
-                    row_list[key] = element[key]
-        csv_formatted_list.append(row_list)
-    return csv_formatted_list
+    return [format_about_dict_for_csv_row(element)
+            for element in about_dictionary_list]
+
+
+def format_about_dict_for_csv_row(element):
+    """
+    Return a CSV row ordered dict formatted from an About data `element` dict.
+    """
+    row_list = OrderedDict()
+    for key in element:
+        if element[key]:
+            if isinstance(element[key], list):
+                row_list[key] = u'\n'.join((element[key]))
+            elif key == u'about_resource':
+                row_list[key] = u'\n'.join((element[key].keys()))
+            else:
+                row_list[key] = element[key]
+    return row_list
 
 
 # FIXME: add docstring
 def format_about_dict_for_json_output(about_dictionary_list):
+    return [format_about_dict_for_json_row(element)
+            for element in about_dictionary_list]
+
+
+def format_about_dict_for_json_row(element):
+    """
+    Return a JSON ordered dict formatted from an About data `element` dict,
+    grouping the license fields in a list of "licenses" mappings.
+    """
     licenses = ['license_key', 'license_name', 'license_file', 'license_url']
-    json_formatted_list = []
-    for element in about_dictionary_list:
-        row_list = OrderedDict()
-        # FIXME: aboid using parallel list... use an object instead
-        license_key = []
-        license_name = []
-        license_file = []
-        license_url = []
-
-        for key in element:
-            if element[key]:
-                # The 'about_resource' is an ordered dict
-                if key == 'about_resource':
-                    row_list[key] = list(element[key].keys())[0]
-                elif key in licenses:
-                    if key == 'license_key':
-                        license_key = element[key]
-                    elif key == 'license_name':
-                        license_name = element[key]
-                    elif key == 'license_file':
-                        license_file = element[key]
-                    elif key == 'license_url':
-                        license_url = element[key]
-                else:
-                    row_list[key] = element[key]
-
-        # Group the same license information in a list
-        license_group = list(zip_longest(license_key, license_name, license_file, license_url))
-        if license_group:
-            licenses_list = []
-            for lic_group in license_group:
-                lic_dict = OrderedDict()
-                if lic_group[0]:
-                    lic_dict['key'] = lic_group[0]
-                if lic_group[1]:
-                    lic_dict['name'] = lic_group[1]
-                if lic_group[2]:
-                    lic_dict['file'] = lic_group[2]
-                if lic_group[3]:
-                    lic_dict['url'] = lic_group[3]
-                licenses_list.append(lic_dict)
-            row_list['licenses'] = licenses_list
-        json_formatted_list.append(row_list)
-    return json_formatted_list
+    row_list = OrderedDict()
+    # FIXME: aboid using parallel list... use an object instead
+    license_key = []
+    license_name = []
+    license_file = []
+    license_url = []
+
+    for key in element:
+        if element[key]:
+            # The 'about_resource' is an ordered dict
+            if key == 'about_resource':
+                row_list[key] = list(element[key].keys())[0]
+            elif key in licenses:
+                if key == 'license_key':
+                    license_key = element[key]
+                elif key == 'license_name':
+                    license_name = element[key]
+                elif key == 'license_file':
+                    license_file = element[key]
+                elif key == 'license_url':
+                    license_url = element[key]
+            else:
+                row_list[key] = element[key]
+
+    # Group the same license information in a list
+    license_group = list(zip_longest(license_key, license_name, license_file, license_url))
+    if license_group:
+        licenses_list = []
+        for lic_group in license_group:
+            lic_dict = OrderedDict()
+            if lic_group[0]:
+                lic_dict['key'] = lic_group[0]
+            if lic_group[1]:
+                lic_dict['name'] = lic_group[1]
+            if lic_group[2]:
+                lic_dict['file'] = lic_group[2]
+            if lic_group[3]:
+                lic_dict['url'] = lic_group[3]
+            licenses_list.append(lic_dict)
+        row_list['licenses'] = licenses_list
+    return row_list
+
+
+_NOT_LISTED = object()
+
+
+class PathIndex(object):
+    """
+    Check the existence of many file system paths listing the content of each
+    parent directory only once rather than stat'ing each path.
+
+    The listings are never refreshed: use a PathIndex only for the duration of
+    an operation where the checked files and directories are not modified,
+    such as when collecting an inventory.
+    """
+
+    def __init__(self):
+        # {parent directory location: {name: is a directory or None}}
+        self.listings = {}
+
+    def get_listing(self, parent):
+        """
+        Return a {name: is_dir} mapping for the content of the `parent`
+        directory. is_dir is None for a symlink.
+        """
+        listing = self.listings.get(parent)
+        if listing is None:
+            listing = {}
+            try:
+                if scandir:
+                    for entry in scandir(parent):
+                        listing[entry.name] = (
+                            None if entry.is_symlink() else entry.is_dir())
+                else:  # pragma: nocover
+                    for name in os.listdir(parent):
+                        listing[name] = os.path.isdir(os.path.join(parent, name))
+            except (OSError, IOError):
+                pass
+            self.listings[parent] = listing
+        return listing
+
+    def get_entry(self, location):
+        """
+        Return the listed is_dir value for `location` in its parent directory
+        listing or the _NOT_LISTED marker if it is not listed.
+        """
+        parent, name = os.path.split(location)
+        if not name:
+            # a root directory is never listed
+            return _NOT_LISTED
+        return self.get_listing(parent).get(name, _NOT_LISTED)
+
+    def exists(self, location):
+        """
+        Return True if the file or directory at `location` exists.
+        """
+        is_dir = self.get_entry(location)
+        if is_dir is _NOT_LISTED or is_dir is None:
+            # a path listed with a different case on a case-insensitive file
+            # system, a root or a symlink: check as usual
+            return os.path.exists(location)
+        return True
+
+    def isdir(self, location):
+        """
+        Return True if `location` is an existing directory.
+        """
+        is_dir = self.get_entry(location)
+        if is_dir is _NOT_LISTED or is_dir is None:
+            return os.path.isdir(location)
+        return is_dir
+
+    def walk(self, location, followlinks=False):
+        """
+        Walk the directory tree at `location` as with os.walk.
+        """
+        return os.walk(location, followlinks=followlinks)
+
+    def getmtime(self, location):
+        """
+        Return the modification time of the file at `location`.
+        """
+        return os.path.getmtime(location)
+
+    def read_text(self, location):
+        """
+        Return the UTF-8 decoded text of the file at `location`.
+        """
+        with io.open(location, encoding='utf-8') as txt:
+            return txt.read()
+
+
+class ZipIndex(object):
+    """
+    Access the files and directories of a zip archive at `location` without
+    extracting it, using the same interface as a PathIndex.
+
+    The archive content is a virtual directory tree rooted at the archive
+    location: the "archive.zip/dir/file.txt" location is the "dir/file.txt"
+    member of "archive.zip". Locations outside of the archive are accessed in
+    the file system as usual.
+
+    Members are read through streams and are extracted only when copied. Each
+    thread reads the archive with its own zipfile.ZipFile.
+    """
+
+    def __init__(self, location):
+        if not zipfile.is_zipfile(location):
+            raise Exception('Incorrect zip file %(location)r' % locals())
+        self.location = location
+        self.root = to_posix(os.path.abspath(location))
+        self.local = threading.local()
+        # the zip files opened by all the threads
+        self.zip_files = []
+        self.lock = threading.Lock()
+        # {member name: ZipInfo or None for a directory}
+        self.entries = {'': None}
+        # {directory name: ([sub-directory names], [file names])}
+        self.children = {'': ([], [])}
+        for info in self.get_zip_file().infolist():
+            name = posixpath.normpath(to_posix(info.filename)).strip('/')
+            if not name or name == '.' or name == '..' or name.startswith('../'):
+                # never access a location outside of the archive
+                continue
+            is_dir = info.filename.endswith('/')
+            self.add(name, None if is_dir else info)
+
+    def add(self, name, info):
+        """
+        Add the `name` member with a ZipInfo `info` and its parent directories
+        to this index.
+        """
+        if name in self.entries:
+            if info is not None and self.entries[name] is not None:
+                self.entries[name] = info
+            return
+        self.entries[name] = info
+        if info is None:
+            self.children[name] = ([], [])
+        parent, base_name = posixpath.split(name)
+        self.add(parent, None)
+        dirs, files = self.children[parent]
+        if info is None:
+            dirs.append(base_name)
+        else:
+            files.append(base_name)
+
+    def __getstate__(self):
+        # the opened zip files cannot be pickled, such as when sent to a
+        # worker process
+        state = dict(self.__dict__)
+        for name in ('local', 'zip_files', 'lock'):
+            del state[name]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.local = threading.local()
+        self.zip_files = []
+        self.lock = threading.Lock()
+
+    def get_zip_file(self):
+        """
+        Return the zipfile.ZipFile of the current thread.
+        """
+        zip_file = getattr(self.local, 'zip_file', None)
+        if zip_file is None:
+            zip_file = self.local.zip_file = zipfile.ZipFile(self.location)
+            with self.lock:
+                self.zip_files.append(zip_file)
+        return zip_file
+
+    def get_name(self, location):
+        """
+        Return the member name of `location` relative to the archive root or
+        None if `location` is not in the archive.
+        """
+        path = norm(location)
+        root = norm(self.root)
+        if path == root:
+            return ''
+        if path.startswith(root + '/'):
+            return path[len(root) + 1:]
+
+    def get_location(self, name):
+        """
+        Return the location of the `name` member.
+        """
+        if not name:
+            return self.root
+        return posixpath.join(self.root, name)
+
+    def exists(self, location):
+        name = self.get_name(location)
+        if name is None:
+            return os.path.exists(location)
+        return name in self.entries
+
+    def isdir(self, location):
+        name = self.get_name(location)
+        if name is None:
+            return os.path.isdir(location)
+        return name in self.entries and self.entries[name] is None
+
+    def walk(self, location, followlinks=False):
+        name = self.get_name(location)
+        if name is None:
+            for top in os.walk(location, followlinks=followlinks):
+                yield top
+            return
+        if not self.isdir(location):
+            return
+        stack = [name]
+        while stack:
+            name = stack.pop()
+            dirs, files = self.children[name]
+            dirs = sorted(dirs)
+            # the dirs list can be modified in place to prune the walk
+            yield self.get_location(name), dirs, sorted(files)
+            stack.extend(posixpath.join(name, d) for d in reversed(dirs))
+
+    def get_info(self, location):
+        """
+        Return the ZipInfo of the file at `location` or raise an IOError.
+        """
+        info = self.entries.get(self.get_name(location))
+        if info is None:
+            raise IOError('No such file in zip: %(location)r' % locals())
+        return info
+
+    def getmtime(self, location):
+        if self.get_name(location) is None:
+            return os.path.getmtime(location)
+        if self.isdir(location):
+            return 0
+        return time.mktime(self.get_info(location).date_time + (0, 0, -1))
+
+    def getsize(self, location):
+        """
+        Return the size of the file at `location`.
+        """
+        if self.get_name(location) is None:
+            return os.path.getsize(location)
+        return self.get_info(location).file_size
+
+    def open(self, location):
+        """
+        Return a binary file-like object to read the file at `location`.
+        """
+        if self.get_name(location) is None:
+            return io.open(location, 'rb')
+        return self.get_zip_file().open(self.get_info(location))
+
+    def read_text(self, location):
+        with self.open(location) as inp:
+            # decode with universal newlines as io.open does
+            return io.TextIOWrapper(inp, encoding='utf-8').read()
+
+    def extract(self, location, target):
+        """
+        Extract the file at `location` to the `target` file location keeping
+        its modification time.
+        """
+        with self.open(location) as inp:
+            with io.open(target, 'wb') as out:
+                shutil.copyfileobj(inp, out)
+        mtime = self.getmtime(location)
+        os.utime(target, (mtime, mtime))
+
+    def close(self):
+        """
+        Close the archive opened in all the threads.
+        """
+        with self.lock:
+            for zip_file in self.zip_files:
+                zip_file.close()
+            self.zip_files = []
+        # the other threads are done with the archive
+        self.local = threading.local()
+
+
+class PathTrie(object):
+    """
+    A prefix tree of POSIX paths split in segments, used to find in a time
+    proportional to the length of a path if one of its ancestors was added.
+
+    For example:
+    >>> trie = PathTrie()
+    >>> trie.add('/a/b')
+    >>> trie.has_ancestor('a/b/c.txt')
+    True
+    >>> trie.has_ancestor('a/bc/d.txt')
+    False
+    >>> trie.has_ancestor('/a/b', strict=True)
+    False
+    >>> trie.add('/')
+    >>> trie.has_ancestor('a/bc/d.txt')
+    True
+    """
+
+    # the key of a node marking the end of an added path: this cannot be a
+    # path segment
+    END = ''
+
+    def __init__(self):
+        self.root = {}
+
+    @staticmethod
+    def split(path):
+        return [segment for segment in to_posix(path).split('/') if segment]
+
+    def add(self, path):
+        """
+        Add a `path` to this trie.
+        """
+        node = self.root
+        for segment in self.split(path):
+            node = node.setdefault(segment, {})
+        node[self.END] = True
+
+    def has_ancestor(self, path, strict=False):
+        """
+        Return True if `path` or one of its parents was added to this trie.
+        Ignore `path` itself if `strict` is True.
+        """
+        segments = self.split(path)
+        if strict:
+            if not segments:
+                # the root has no parent
+                return False
+            segments = segments[:-1]
+        node = self.root
+        if self.END in node:
+            # the root was added
+            return True
+        for segment in segments:
+            node = node.get(segment)
+            if node is None:
+                return False
+            if self.END in node:
+                return True
+        return False
+
+
+class TextCache(object):
+    """
+    A least recently used cache of the texts of files keyed by location and
+    modification time, bounded to a `max_size` total number of characters.
+
+    Identical texts loaded from different locations are interned and share a
+    single string object, such that the same license text referenced by many
+    ABOUT files is loaded and kept in memory only once.
+    """
+
+    def __init__(self, max_size=64 * 1024 * 1024):
+        self.max_size = max_size
+        # total number of characters of the unique texts in this cache
+        self.size = 0
+        # {(location, mtime): text} in least recently used first order
+        self.texts = OrderedDict()
+        # {location: mtime} of the single cached text of each location
+        self.mtimes = {}
+        # {text: text} to intern the texts and the count of their references
+        self.interned = {}
+        self.references = {}
+
+    def get(self, location, path_index=None):
+        """
+        Return the text of the file at `location` loading it if needed with
+        the optional `path_index` PathIndex or ZipIndex.
+        """
+        if path_index is None:
+            path_index = PathIndex()
+        mtime = path_index.getmtime(location)
+        old_mtime = self.mtimes.get(location, mtime)
+        if old_mtime != mtime:
+            # the file was modified: drop its outdated text
+            self.release(self.texts.pop((location, old_mtime)))
+        key = location, mtime
+        text = self.texts.pop(key, None)
+        if text is None:
+            text = path_index.read_text(location)
+            text = self.intern(text)
+        # (re)insert last as the most recently used
+        self.texts[key] = text
+        self.mtimes[location] = mtime
+        self.evict()
+        return text
+
+    def intern(self, text):
+        """
+        Return an interned `text` and count a new reference to this text.
+        """
+        interned = self.interned.get(text)
+        if interned is None:
+            interned = self.interned[text] = text
+            self.references[text] = 0
+            self.size += len(text)
+        self.references[interned] += 1
+        return interned
+
+    def release(self, text):
+        """
+        Remove a reference to an interned `text` and forget this text once it
+        is no longer referenced.
+        """
+        self.references[text] -= 1
+        if not self.references[text]:
+            del self.references[text]
+            del self.interned[text]
+            self.size -= len(text)
+
+    def evict(self):
+        """
+        Remove least recently used entries until this cache is not larger than
+        its max_size.
+        """
+        while self.size > self.max_size and self.texts:
+            (location, _mtime), text = self.texts.popitem(last=False)
+            del self.mtimes[location]
+            self.release(text)
 
 
 def unique(sequence):
@@ -621,9 +1399,27 @@ def unique(sequence):
     [1, 5, 3]
     """
     deduped = []
+    seen = set()
+    # items that are not hashable or that are hashed by identity but compared
+    # by value (such as About objects) are compared one by one
+    others = []
     for item in sequence:
-        if item not in deduped:
-            deduped.append(item)
+        item_hash = type(item).__hash__
+        if item_hash and item_hash is not object.__hash__:
+            try:
+                if item in seen:
+                    continue
+                seen.add(item)
+                deduped.append(item)
+                continue
+            except TypeError:
+                # a hashable type may hold unhashable items such as a tuple
+                # of lists
+                pass
+        if item in others:
+            continue
+        others.append(item)
+        deduped.append(item)
     return deduped
 
 
@@ -22,10 +22,12 @@ import io
 import os
 import unittest
 
+from testing_utils import get_temp_dir
 from testing_utils import get_test_loc
 from testing_utils import get_temp_file
 
 from attributecode import attrib
+from attributecode import attrib_util
 from attributecode import model
 
 class TemplateTest(unittest.TestCase):
@@ -71,6 +73,31 @@ class TemplateTest(unittest.TestCase):
             except:
                 raise Exception(template_loc)
 
+    def test_get_template_compiles_the_same_text_once(self):
+        text = "{% for item in items|multi_sort(attributes=['name']) %}{{ item.name }}{% endfor %}"
+        template = attrib_util.get_template(text)
+        assert template is attrib_util.get_template(text)
+        items = [dict(name='b'), dict(name='a')]
+        assert 'ab' == template.render(items=items)
+
+    def test_get_template_keeps_only_the_most_recent_texts(self):
+        loader = attrib_util.get_environment().loader
+        for i in range(loader.max_size + 10):
+            template = attrib_util.get_template('{{ text }} %d' % i)
+        assert loader.max_size == len(loader.texts)
+        assert 'a %d' % (loader.max_size + 9) == template.render(text='a')
+
+    def test_get_bytecode_cache_uses_the_environment_variable(self):
+        location = os.environ[attrib_util.TEMPLATE_CACHE_ENV]
+        assert location == attrib_util.get_bytecode_cache().directory
+        other = os.path.join(get_temp_dir(), 'templates')
+        assert other == attrib_util.get_bytecode_cache(other).directory
+        assert None is attrib_util.get_bytecode_cache('')
+
+    def test_get_template_does_not_autoescape(self):
+        template = attrib_util.get_template('{{ text }}')
+        assert '<b>&</b>' == template.render(text='<b>&</b>')
+
 
 class GenerateTest(unittest.TestCase):
 
@@ -109,6 +136,33 @@ class GenerateTest(unittest.TestCase):
         expected = remove_timestamp(expected)
         assert expected == result
 
+    def test_generate_and_save_removes_partial_output_on_error(self):
+        test_file = get_test_loc('test_attrib/gen_license_key_name_check/test.ABOUT')
+        template_loc = get_temp_file()
+        with io.open(template_loc, 'w', encoding='utf-8') as tmpl:
+            tmpl.write('{% for about in abouts %}{{ about.name.value }}{% endfor %}{{ 1 // 0 }}')
+        output_file = get_temp_file()
+
+        _errors, abouts = model.collect_inventory(test_file)
+        errors, rendered = attrib.generate_and_save(abouts, output_file, template_loc)
+        assert None is rendered
+        assert errors[-1].message.startswith('Template processing error:')
+        assert not os.path.exists(output_file)
+
+    def test_LicenseIndex_maps_license_keys_names_and_files(self):
+        test_file = get_test_loc('test_attrib/gen_license_key_name_check/test.ABOUT')
+        _errors, abouts = model.collect_inventory(test_file)
+        license_index = attrib.LicenseIndex()
+        for about in abouts:
+            assert None is license_index.add(about)
+
+        mappings = license_index.get_mappings()
+        expected = {'Apache-2.0': 'Apache License 2.0', 'LGPL-3.0-or-later': 'LGPL'}
+        assert expected == mappings['license_key_and_license_name']
+        expected = ['LICENSES/Apache-2.0.txt', 'LICENSES/LGPL-3.0.txt']
+        assert expected == list(mappings['license_file_key_and_context'])
+        assert 'Apache License 2.0 OR LGPL' == abouts[0].license_name_expression
+
     def test_lic_key_name_sync(self):
         test_file = get_test_loc('test_attrib/gen_license_key_name_check/test.ABOUT')
         expected = get_test_loc('test_attrib/gen_license_key_name_check/expected/expected.html')
@@ -0,0 +1,157 @@
+#!/usr/bin/env python
+# -*- coding: utf8 -*-
+
+# ============================================================================
+#  Copyright (c) 2020 nexB Inc. http://www.nexb.com/ - All rights reserved.
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#      http://www.apache.org/licenses/LICENSE-2.0
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+# ============================================================================
+
+from __future__ import absolute_import
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import io
+import os
+import shutil
+import unittest
+
+from testing_utils import get_temp_dir
+from testing_utils import get_temp_file
+from testing_utils import get_test_loc
+
+from attributecode import ERROR
+from attributecode import Error
+from attributecode import cache
+from attributecode import model
+
+
+class InventoryCacheTest(unittest.TestCase):
+
+    def get_test_inventory(self):
+        test_dir = os.path.join(get_temp_dir(), 'basic')
+        shutil.copytree(get_test_loc('test_model/inventory/basic'), test_dir)
+        return test_dir
+
+    def collect_with_cache(self, location, cache_location):
+        inventory_cache = cache.InventoryCache(cache_location)
+        try:
+            errors, abouts = model.collect_inventory(location, cache=inventory_cache)
+        finally:
+            inventory_cache.close()
+        return errors, abouts, inventory_cache
+
+    def test_collect_inventory_with_cache_reuses_unchanged_about_files(self):
+        test_dir = self.get_test_inventory()
+        cache_location = get_temp_file()
+        errors1, abouts1, inventory_cache = self.collect_with_cache(test_dir, cache_location)
+        assert 0 == inventory_cache.hits
+        assert 1 == inventory_cache.misses
+
+        errors2, abouts2, inventory_cache = self.collect_with_cache(test_dir, cache_location)
+        assert 1 == inventory_cache.hits
+        assert 0 == inventory_cache.misses
+        assert errors1 == errors2
+        assert abouts1 == abouts2
+
+    def test_collect_inventory_with_cache_reloads_modified_about_files(self):
+        test_dir = self.get_test_inventory()
+        cache_location = get_temp_file()
+        self.collect_with_cache(test_dir, cache_location)
+
+        about_file = os.path.join(test_dir, 'about', 'about.ABOUT')
+        with io.open(about_file, 'a', encoding='utf-8') as af:
+            af.write('\nowner_url: http://nexb.com\n')
+
+        _errors, abouts, inventory_cache = self.collect_with_cache(test_dir, cache_location)
+        assert 0 == inventory_cache.hits
+        assert 'http://nexb.com' == abouts[0].owner_url.value
+
+    def test_collect_inventory_with_cache_reloads_when_license_file_changes(self):
+        test_dir = self.get_test_inventory()
+        cache_location = get_temp_file()
+        self.collect_with_cache(test_dir, cache_location)
+
+        license_file = os.path.join(test_dir, 'about', 'apache-2.0.LICENSE')
+        with io.open(license_file, 'w', encoding='utf-8') as lf:
+            lf.write('Some modified license text')
+
+        _errors, abouts, inventory_cache = self.collect_with_cache(test_dir, cache_location)
+        assert 0 == inventory_cache.hits
+        expected = {'apache-2.0.LICENSE': 'Some modified license text'}
+        assert expected == dict(abouts[0].license_file.value)
+
+    def test_collect_inventory_with_cache_reloads_when_notice_file_is_deleted(self):
+        test_dir = self.get_test_inventory()
+        cache_location = get_temp_file()
+        errors1, _abouts, _cache = self.collect_with_cache(test_dir, cache_location)
+        assert [] == errors1
+
+        os.remove(os.path.join(test_dir, 'about', 'NOTICE'))
+
+        errors2, _abouts, inventory_cache = self.collect_with_cache(test_dir, cache_location)
+        assert 0 == inventory_cache.hits
+        assert errors2
+
+
+class LicenseCacheTest(unittest.TestCase):
+
+    def test_LicenseCache_get_returns_cached_license_data(self):
+        license_cache = cache.LicenseCache(get_temp_dir())
+        license_data = dict(key='mit', name='MIT License', full_text='Permission')
+        license_cache.put('https://example.com/api/v2/licenses/', 'mit', license_data)
+
+        result = license_cache.get('https://example.com/api/v2/licenses', 'mit')
+        expected = dict(key='mit', name='MIT License', full_text='Permission')
+        assert expected == result
+        assert None is license_cache.get('https://example.com/api/v2/licenses', 'bsd-new')
+        assert None is license_cache.get('https://other.example.com/', 'mit')
+
+    def test_LicenseCache_get_stale_license_data(self):
+        license_cache = cache.LicenseCache(get_temp_dir(), max_age=-1)
+        license_data = dict(key='mit', name='MIT License', full_text='Permission')
+        license_cache.put('https://example.com/', 'mit', license_data)
+
+        assert None is license_cache.get('https://example.com/', 'mit')
+        result = license_cache.get('https://example.com/', 'mit', allow_stale=True)
+        assert 'MIT License' == result['name']
+
+    def test_pre_process_and_fetch_license_dict_offline_uses_only_the_cache(self):
+        license_cache = cache.LicenseCache(get_temp_dir(), max_age=-1)
+        license_data = dict(key='mit', name='MIT License', full_text='Permission')
+        license_cache.put('https://example.com/', 'mit', license_data)
+        about = model.About()
+        about.load_dict({'license_expression': 'mit or gpl-2.0'}, base_dir='')
+
+        result = model.pre_process_and_fetch_license_dict(
+            [about], 'https://example.com/', '', license_cache=license_cache, offline=True)
+        expected = (
+            {'mit': ['MIT License', 'Permission',
+                     'https://example.com/urn/?urn=urn:dje:license:mit']},
+            [Error(ERROR, 'License gpl-2.0 is not available in the license cache.')]
+        )
+        assert expected == result
+
+    def test_pre_process_and_fetch_license_dict_uses_stale_cache_if_the_api_fails(self):
+        # nothing listens on this port
+        api_url = 'http://127.0.0.1:1/api/v2/licenses/'
+        license_cache = cache.LicenseCache(get_temp_dir(), max_age=-1)
+        license_data = dict(key='mit', name='MIT License', full_text='Permission')
+        license_cache.put(api_url, 'mit', license_data)
+        about = model.About()
+        about.load_dict({'license_expression': 'mit'}, base_dir='')
+
+        key_text_dict, errors = model.pre_process_and_fetch_license_dict(
+            [about], api_url, '', license_cache=license_cache)
+        expected = {'mit': ['MIT License', 'Permission',
+                            'http://127.0.0.1:1/urn/?urn=urn:dje:license:mit']}
+        assert expected == key_text_dict
+        assert 1 == len(errors)
+        assert errors[0].message.startswith('Cannot connect to the license API')
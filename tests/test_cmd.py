@@ -19,6 +19,7 @@ from __future__ import print_function
 from __future__ import unicode_literals
 
 import io
+import os
 import unittest
 
 from attributecode import CRITICAL
@@ -416,6 +417,18 @@ def test_about_transform_command_can_run_minimally_without_error():
     run_about_command_test_click(['transform', test_file, result])
 
 
+def test_about_collect_redist_src_rejects_workers_and_hardlink_with_zip():
+    test_dir = get_test_loc('test_cmd/repository-mini')
+    output = get_temp_file('redist.zip')
+    for option in (['--workers', '2'], ['--hardlink']):
+        result = run_about_command_test_click(
+            ['collect_redist_src', '--zip'] + option + [test_dir, output],
+            expected_rc=2)
+        assert (b'The --workers and --hardlink options cannot be used with '
+                b'the --zip option.') in result.output_bytes
+        assert not os.path.exists(output)
+
+
 def test_about_transform_help_text():
     check_about_stdout(
         ['transform', '--help'],
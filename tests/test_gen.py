@@ -19,9 +19,14 @@ from __future__ import print_function
 from __future__ import unicode_literals
 
 from collections import OrderedDict
+import io
+import os
 import unittest
 
+import mock
+
 from testing_utils import get_temp_dir
+from testing_utils import get_temp_file
 from testing_utils import get_test_loc
 
 from attributecode import ERROR
@@ -45,16 +50,19 @@ class GenTest(unittest.TestCase):
         result = gen.check_duplicated_columns(test_file)
         assert expected == result
 
-    def test_check_duplicated_about_resource(self):
-        arp_list = ['/test/test.c', 'test/test1.h']
-        arp1 = '/test/test.c'
-        arp2 = '/test/tmp/test.c'
-        expected = Error(CRITICAL,
-                  "The input has duplicated values in 'about_resource' field: " + arp1)
-        result1 = gen.check_duplicated_about_resource(arp1, arp_list)
-        result2 = gen.check_duplicated_about_resource(arp2, arp_list)
-        assert result1 == expected
-        assert result2 == ''
+    def test_get_duplicated_about_resources_errors_reports_all_rows(self):
+        rows_by_arp = OrderedDict([
+            ('test.c', [2, 4, 6]),
+            ('test.h', [3, 5]),
+            ('other.c', [7]),
+        ])
+        expected = [
+            Error(CRITICAL, "The input has duplicated values in 'about_resource' "
+                            "field: test.c (rows: 2, 4, 6)"),
+            Error(CRITICAL, "The input has duplicated values in 'about_resource' "
+                            "field: test.h (rows: 3, 5)"),
+        ]
+        assert expected == gen.get_duplicated_about_resources_errors(rows_by_arp)
 
     def test_check_newline_in_file_field(self):
         test_dict1 = {'about_resource': '/test/test.c', 'name': 'test.c', 'notice_file': 'NOTICE\nNOTICE2'}
@@ -148,6 +156,16 @@ custom1: |
         assert expected_errors_msg1 in errors[0].message or expected_errors_msg1 in errors[1].message
         assert expected_errors_msg2 in errors[0].message or expected_errors_msg2 in errors[1].message
 
+    def test_generation_dir_endswith_space_creates_no_directory(self):
+        location = get_temp_file('inventory.csv')
+        with io.open(location, 'w', encoding='utf-8') as inv:
+            inv.write(u'about_resource,name\n"foo /bar.c",bar\n')
+        base_dir = get_temp_dir()
+        for workers in (1, 4):
+            errors, _abouts = gen.generate(location, base_dir, workers=workers)
+            assert any('Generation skipped' in e.message for e in errors)
+            assert [] == os.listdir(base_dir)
+
     def test_generation_with_no_about_resource(self):
         location = get_test_loc('test_gen/inv2.csv')
         base_dir = get_temp_dir()
@@ -204,6 +222,100 @@ custom1: |
         )
         assert expected == result
 
+    def test_generate_with_workers_is_the_same_as_sequential(self):
+        location = get_temp_file('inventory.csv')
+        with io.open(location, 'w', encoding='utf-8') as inv:
+            inv.write(u'about_resource,name,custom1\n')
+            for i in range(40):
+                inv.write(u'dir%d/sub/file%d.c,file%d,custom\n' % (i % 5, i, i))
+
+        base_dir1 = get_temp_dir()
+        errors1, abouts1 = gen.generate(location, base_dir1)
+        base_dir2 = get_temp_dir()
+        errors2, abouts2 = gen.generate(location, base_dir2, workers=4)
+
+        errors2 = [Error(e.severity, e.message.replace(base_dir2, base_dir1)) for e in errors2]
+        assert errors1 == errors2
+        assert [a.dumps() for a in abouts1] == [a.dumps() for a in abouts2]
+        for i in range(40):
+            about_file = 'dir%d/sub/file%d.c.ABOUT' % (i % 5, i)
+            with io.open(os.path.join(base_dir1, about_file), encoding='utf-8') as af1:
+                with io.open(os.path.join(base_dir2, about_file), encoding='utf-8') as af2:
+                    assert af1.read() == af2.read()
+
+    def test_iter_generate_writes_each_about_file_before_reading_the_next_row(self):
+        location = get_temp_file('inventory.csv')
+        with io.open(location, 'w', encoding='utf-8') as inv:
+            inv.write(u'about_resource,name\n')
+            for i in range(3):
+                inv.write(u'file%d.c,file%d\n' % (i, i))
+
+        base_dir = get_temp_dir()
+        generated = gen.iter_generate(location, base_dir)
+        for i in range(3):
+            _errors, about = next(generated)
+            assert 'file%d.c' % i == about.about_file_path
+            assert os.path.exists(os.path.join(base_dir, 'file%d.c.ABOUT' % i))
+            assert not os.path.exists(os.path.join(base_dir, 'file%d.c.ABOUT' % (i + 1)))
+        assert [] == list(generated)
+
+    def test_load_inventory_reads_the_inventory_once(self):
+        location = get_test_loc('test_gen/inv.csv')
+        with mock.patch.object(gen, 'read_inventory', wraps=gen.read_inventory) as read:
+            errors, abouts = gen.load_inventory(location, get_temp_dir())
+        assert 1 == read.call_count
+        assert 1 == len(abouts)
+
+    def test_load_inventory_discards_abouts_of_an_inventory_with_duplicates(self):
+        location = get_temp_file('inventory.csv')
+        with io.open(location, 'w', encoding='utf-8') as inv:
+            inv.write(u'about_resource,name\nfile.c,file\nother.c,other\nfile.c,file\n')
+        errors, abouts = gen.load_inventory(location, get_temp_dir())
+        msg = ("The input has duplicated values in 'about_resource' "
+               "field: file.c (rows: 2, 4)")
+        assert [Error(CRITICAL, msg)] == errors
+        assert [] == abouts
+
+    def test_load_inventory_of_a_rejected_inventory_copies_no_reference_files(self):
+        reference_dir = get_temp_dir()
+        with io.open(os.path.join(reference_dir, 'mit.LICENSE'), 'w', encoding='utf-8') as lic:
+            lic.write(u'MIT license text')
+        location = get_temp_file('inventory.csv')
+        with io.open(location, 'w', encoding='utf-8') as inv:
+            inv.write(u'about_resource,name,license_file\n')
+            inv.write(u'file.c,file,mit.LICENSE\n')
+            inv.write(u'file.c,file,mit.LICENSE\n')
+        base_dir = get_temp_dir()
+        errors, abouts = gen.load_inventory(location, base_dir, reference_dir=reference_dir)
+        msg = ("The input has duplicated values in 'about_resource' "
+               "field: file.c (rows: 2, 3)")
+        assert [Error(CRITICAL, msg)] == errors
+        assert [] == abouts
+        assert [] == os.listdir(base_dir)
+
+    @mock.patch.object(gen.model, 'pre_process_and_fetch_license_dict')
+    def test_generate_with_fetch_license_reads_the_inventory_twice(self, fetch):
+        fetch.return_value = {}, []
+        location = get_temp_file('inventory.csv')
+        with io.open(location, 'w', encoding='utf-8') as inv:
+            inv.write(u'about_resource,name,license_expression\n')
+            for i in range(4):
+                inv.write(u'file%d.c,file%d,mit\n' % (i, i))
+        with mock.patch.object(gen, 'read_inventory', wraps=gen.read_inventory) as read:
+            _errors, abouts = gen.generate(
+                location, get_temp_dir(), fetch_license=['url', 'key'])
+        assert 2 == read.call_count
+        assert 4 == len(abouts)
+        # the licenses of each unique expression are fetched once
+        license_abouts = list(fetch.call_args[0][0])
+        assert ['mit'] == [a.license_expression.value for a in license_abouts]
+
+    def test_load_inventory_reports_duplicated_columns_from_the_csv_header(self):
+        location = get_test_loc('test_gen/dup_keys.csv')
+        errors, abouts = gen.load_inventory(location, get_temp_dir())
+        assert gen.check_duplicated_columns(location) == errors
+        assert [] == abouts
+
     def test_generate_multi_lic_issue_443(self):
         location = get_test_loc('test_gen/multi_lic_issue_443/test.csv')
         base_dir = get_temp_dir()
@@ -35,6 +35,7 @@ from attributecode import INFO
 from attributecode import WARNING
 from attributecode import Error
 from attributecode import model
+from attributecode import util
 from attributecode.util import add_unc, norm, on_windows
 from attributecode.util import load_csv
 from attributecode.util import to_posix
@@ -120,6 +121,11 @@ class FieldTest(unittest.TestCase):
         model.FileTextField()
         model.PackageUrlField()
 
+    def test_Field_has_no_instance_dict(self):
+        for field_class in (model.Field, model.StringField, model.PathField,
+                            model.AboutResourceField, model.BooleanField):
+            assert not hasattr(field_class(), '__dict__')
+
     def test_empty_Field_has_no_content(self):
         field = model.Field()
         assert not field.has_content
@@ -535,6 +541,18 @@ class AboutTest(unittest.TestCase):
         ]
         assert sorted(expected) == sorted(result)
 
+    def test_About_standard_and_custom_fields_are_attributes(self):
+        test_file = get_test_loc('test_model/custom_fields/custom_fields.about')
+        a = model.About(test_file)
+        assert a.fields['name'] is a.name
+        assert a.custom_fields['single_line'] is a.single_line
+        # absent standard fields are created on first access
+        assert 'vcs_tool' not in a.fields
+        assert '' == a.vcs_tool.value
+        assert a.fields['vcs_tool'] is a.vcs_tool
+        names = [f.name for f in a.all_fields() if f.name in a.fields]
+        assert [n for n in model.About.standard_field_names if n in a.fields] == names
+
     def test_About_has_errors_for_illegal_custom_field_name(self):
         test_file = get_test_loc('test_model/parse/illegal_custom_field.about')
         a = model.About(test_file)
@@ -990,6 +1008,19 @@ custom1: |
         expected = get_test_loc('test_model/expected.json')
         check_json(expected, result)
 
+    def test_save_as_json_is_the_same_as_json_dumps(self):
+        location = get_test_loc('test_model/inventory/complex')
+        _errors, abouts = model.collect_inventory(location)
+        about_dicts = model.about_object_to_list_of_dictionary(abouts)
+        assert len(about_dicts) > 1
+        for dicts in (about_dicts, about_dicts[:1], []):
+            result = get_temp_file()
+            model.save_as_json(result, iter(dicts))
+            expected = json.dumps(
+                util.format_about_dict_for_json_output(dicts), indent=2)
+            with io.open(result, encoding='utf-8') as res:
+                assert expected == res.read()
+
     def test_android_module_license(self):
         path = 'test_model/android/single_license.c.ABOUT'
         test_file = get_test_loc(path)
@@ -1142,6 +1173,34 @@ class CollectorTest(unittest.TestCase):
         assert expected_lic == returned_lic
         assert expected_spec_char == spec_char
 
+    def test_LicenseExpressionParser_remembers_recently_parsed_expressions(self):
+        parser = model.LicenseExpressionParser(max_size=2)
+        spec_char, lic_list = parser.parse('mit or apache-2.0')
+        assert ['mit', 'apache-2.0'] == lic_list
+        lic_list.append('gpl-2.0')
+        assert ([], ['mit', 'apache-2.0']) == parser.parse('mit or apache-2.0')
+        parser.parse('bsd-new')
+        parser.parse('gpl-2.0')
+        parser.parse('bsd-new')
+        assert 2 == parser.hits
+        assert 3 == parser.misses
+        assert ['gpl-2.0', 'bsd-new'] == list(parser.parsed)
+
+    def test_LicenseExpressionParser_can_be_shared_by_threads(self):
+        from multiprocessing.pool import ThreadPool
+        parser = model.LicenseExpressionParser(max_size=10)
+        expressions = ['mit or lic-%d' % (i % 40) for i in range(2000)]
+        pool = ThreadPool(8)
+        try:
+            results = pool.map(parser.parse, expressions, chunksize=1)
+        finally:
+            pool.close()
+            pool.join()
+        expected = [([], ['mit', 'lic-%d' % (i % 40)]) for i in range(2000)]
+        assert expected == results
+        assert 2000 == parser.hits + parser.misses
+        assert len(parser.parsed) <= 10
+
     def test_collect_inventory_works_with_relative_paths(self):
         # FIXME: This test need to be run under src/attributecode/
         # or otherwise it will fail as the test depends on the launching
@@ -1161,6 +1220,14 @@ class CollectorTest(unittest.TestCase):
         assert expected == result1
         assert expected == result2
 
+    def test_collect_inventory_with_processes_is_the_same_as_sequential(self):
+        test_loc = get_test_loc('test_model/collect_inventory_errors')
+        errors1, abouts1 = model.collect_inventory(test_loc)
+        errors2, abouts2 = model.collect_inventory(test_loc, processes=2)
+        assert errors1 == errors2
+        assert [a.about_file_path for a in abouts1] == [a.about_file_path for a in abouts2]
+        assert abouts1 == abouts2
+
     def test_collect_inventory_basic_from_directory(self):
         location = get_test_loc('test_model/inventory/basic')
         result = get_temp_file()
@@ -1258,6 +1325,57 @@ class CollectorTest(unittest.TestCase):
         for file in expected_file:
             assert file in copied_files
 
+    def test_copy_redist_src_in_zip_with_structure(self):
+        test_loc = get_test_loc('test_model/redistribution/')
+        copy_list = [get_test_loc('test_model/redistribution/this.c'), get_test_loc('test_model/redistribution/test/subdir')]
+        output = get_temp_file('redist.zip')
+
+        copier = util.ZipCopier(output, compression_level=9)
+        try:
+            err = model.copy_redist_src(copy_list, test_loc, '', True, copier=copier)
+        finally:
+            copier.close()
+        assert err == []
+
+        import zipfile
+        with zipfile.ZipFile(output) as zf:
+            names = sorted(zf.namelist())
+            expected = ['test/', 'test/subdir/', 'test/subdir/test.ABOUT', 'test/subdir/test.c', 'this.c']
+            assert expected == names
+            with io.open(get_test_loc('test_model/redistribution/test/subdir/test.ABOUT'), 'rb') as tf:
+                assert tf.read() == zf.read('test/subdir/test.ABOUT')
+
+    def test_collect_inventory_and_copy_redist_src_from_zip(self):
+        import zipfile
+        test_loc = get_test_loc('test_model/redistribution/')
+        zip_location = get_temp_file('redistribution.zip')
+        with zipfile.ZipFile(zip_location, 'w') as zf:
+            for top, _dirs, files in os.walk(test_loc):
+                for name in files:
+                    location = os.path.join(top, name)
+                    zf.write(location, os.path.relpath(location, test_loc))
+
+        zip_index = util.ZipIndex(zip_location)
+        try:
+            errors, abouts = model.collect_inventory(zip_index.root, path_index=zip_index)
+            expected_errors, expected_abouts = model.collect_inventory(test_loc)
+            assert [a.about_file_path for a in expected_abouts] == [a.about_file_path for a in abouts]
+            assert len(expected_errors) == len(errors)
+
+            copy_list, err = model.get_copy_list(abouts, zip_index.root, path_index=zip_index)
+            assert err == []
+            output = get_temp_dir()
+            copier = util.FileCopier(source=zip_index)
+            err = model.copy_redist_src(copy_list, zip_index.root, output, True, copier=copier)
+            assert err == []
+        finally:
+            zip_index.close()
+
+        with io.open(os.path.join(output, 'test/subdir/test.ABOUT'), 'rb') as of:
+            with io.open(os.path.join(test_loc, 'test/subdir/test.ABOUT'), 'rb') as tf:
+                assert tf.read() == of.read()
+        assert ['test', 'this.c'] == sorted(os.listdir(output))
+
     def test_get_copy_list(self):
         location = get_test_loc('test_model/redistribution/')
         result = get_temp_file()
@@ -1273,25 +1391,58 @@ class CollectorTest(unittest.TestCase):
         else:
             assert copy_list == expected
 
-class FetchLicenseTest(unittest.TestCase):
+    def test_get_copy_list_summarizes_nested_directories(self):
+        location = get_temp_dir()
+        for path in ('a/b', 'ab', 'c'):
+            os.makedirs(os.path.join(location, path))
+        for path in ('a/b/x.c', 'ab/y.c', 'c/z.c', 'root.c'):
+            with io.open(os.path.join(location, path), 'w') as tf:
+                tf.write(u'test')
+
+        abouts = []
+        for path in ('a/b', 'a', 'ab', 'a/b/x.c', 'ab/y.c', 'c/z.c', 'root.c', 'a'):
+            about = model.About()
+            about.redistribute.value = True
+            about.about_resource.value = {path: os.path.join(location, path)}
+            abouts.append(about)
+
+        copy_list, errors = model.get_copy_list(abouts, location)
+        assert [] == errors
+        expected = [
+            os.path.join(location, 'root.c'),
+            os.path.join(location, 'a'),
+            os.path.join(location, 'ab'),
+            os.path.join(location, 'c/z.c'),
+        ]
+        assert expected == copy_list
 
-    @mock.patch.object(model, 'urlopen')
-    def test_valid_api_url(self, mock_data):
-        mock_data.return_value = ''
-        assert model.valid_api_url('non_valid_url') is False
-
-    @mock.patch('attributecode.util.have_network_connection')
-    @mock.patch('attributecode.model.valid_api_url')
-    def test_pre_process_and_fetch_license_dict(self, have_network_connection, valid_api_url):
-        have_network_connection.return_value = True
-
-        valid_api_url.return_value = False
-        error_msg = (
-            'Network problem. Please check your Internet connection. '
-            'License generation is skipped.')
-        expected = ({}, [Error(ERROR, error_msg)])
-        assert model.pre_process_and_fetch_license_dict([], '', '') == expected
+        # the location root contains everything else
+        abouts = []
+        for path in ('.', 'a', 'a/b/x.c'):
+            about = model.About()
+            about.redistribute.value = True
+            about.about_resource.value = {path: os.path.join(location, path)}
+            abouts.append(about)
+
+        copy_list, errors = model.get_copy_list(abouts, location)
+        assert [] == errors
+        assert [os.path.join(location, '')] == copy_list
 
-        valid_api_url.return_value = True
+class FetchLicenseTest(unittest.TestCase):
+
+    @mock.patch.object(model.api, 'LicenseFetcher')
+    def test_pre_process_and_fetch_license_dict(self, license_fetcher):
         expected = ({}, [])
         assert model.pre_process_and_fetch_license_dict([], '', '') == expected
+        # nothing to fetch: the network is never accessed
+        assert not license_fetcher.called
+
+    @mock.patch.object(model.api, 'LicenseFetcher')
+    def test_pre_process_and_fetch_license_dict_reports_fetch_errors(self, license_fetcher):
+        error = Error(ERROR, "URL not reachable. Invalid '--api_url'. License generation is skipped.")
+        license_fetcher.return_value.fetch.return_value = {}, [error]
+        about = model.About()
+        about.load_dict({'license_expression': 'mit'}, base_dir='')
+        result = model.pre_process_and_fetch_license_dict([about], 'http://fake.url/', '')
+        assert ({}, [error]) == result
+        license_fetcher.assert_called_once_with('http://fake.url/', '', timeout=10)
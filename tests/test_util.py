@@ -19,7 +19,11 @@ from __future__ import print_function
 from __future__ import unicode_literals
 
 from collections import OrderedDict
+import io
+import os
+import posixpath
 import string
+import sys
 import unittest
 
 import saneyaml
@@ -27,11 +31,14 @@ import saneyaml
 from testing_utils import extract_test_loc
 from testing_utils import get_test_loc
 from testing_utils import get_temp_dir
+from testing_utils import get_temp_file
 from testing_utils import on_posix
 from testing_utils import on_windows
 
 from attributecode import CRITICAL
 from attributecode import Error
+from attributecode import INFO
+from attributecode import WARNING
 from attributecode import model
 from attributecode import util
 
@@ -275,6 +282,27 @@ class TestGetLocations(unittest.TestCase):
         result = [l.partition('/about_locations/')[-1] for l in result]
         assert expected == result
 
+    def test_get_locations_with_ignores(self):
+        test_dir = get_test_loc('test_util/about_locations')
+        expected = sorted([
+            'file with_spaces.ABOUT',
+            'file2'])
+
+        result = sorted(util.get_locations(test_dir, ignores=['dir1', 'file1']))
+        result = [l.partition('/about_locations/')[-1] for l in result]
+        assert expected == result
+
+    def test_get_about_locations_with_ignores_on_paths(self):
+        test_dir = get_test_loc('test_util/about_locations')
+        expected = sorted([
+            'file with_spaces.ABOUT',
+            'dir1/file2.aBout',
+        ])
+
+        result = sorted(util.get_about_locations(test_dir, ignores=['dir1/dir2']))
+        result = [l.partition('/about_locations/')[-1] for l in result]
+        assert expected == result
+
     def test_get_locations_can_yield_a_single_file(self):
         test_file = get_test_loc('test_util/about_locations/file with_spaces.ABOUT')
         result = list(util.get_locations(test_file))
@@ -491,8 +519,195 @@ class TestJson(unittest.TestCase):
         assert output == expected
 
 
+class TestTextCache(unittest.TestCase):
+
+    def create_file(self, location, text):
+        with io.open(location, 'w', encoding='utf-8') as tf:
+            tf.write(text)
+        return location
+
+    def test_TextCache_interns_identical_texts(self):
+        test_dir = get_temp_dir()
+        loc1 = self.create_file(os.path.join(test_dir, 'mit.LICENSE'), 'some license text')
+        loc2 = self.create_file(os.path.join(test_dir, 'mit2.LICENSE'), 'some license text')
+        cache = util.TextCache()
+        text1 = cache.get(loc1)
+        text2 = cache.get(loc2)
+        assert 'some license text' == text1
+        assert text1 is text2
+        assert len('some license text') == cache.size
+
+    def test_TextCache_evicts_least_recently_used_texts(self):
+        test_dir = get_temp_dir()
+        loc1 = self.create_file(os.path.join(test_dir, 'a.LICENSE'), 'a' * 10)
+        loc2 = self.create_file(os.path.join(test_dir, 'b.LICENSE'), 'b' * 10)
+        loc3 = self.create_file(os.path.join(test_dir, 'c.LICENSE'), 'c' * 10)
+        cache = util.TextCache(max_size=20)
+        cache.get(loc1)
+        cache.get(loc2)
+        cache.get(loc1)
+        cache.get(loc3)
+        assert 20 == cache.size
+        assert ['a' * 10, 'c' * 10] == list(cache.texts.values())
+
+    def test_TextCache_reloads_modified_files(self):
+        test_dir = get_temp_dir()
+        location = self.create_file(os.path.join(test_dir, 'a.LICENSE'), 'some text')
+        cache = util.TextCache()
+        assert 'some text' == cache.get(location)
+        self.create_file(location, 'some other text')
+        stat = os.stat(location)
+        os.utime(location, (stat.st_atime, stat.st_mtime + 10))
+        assert 'some other text' == cache.get(location)
+        # the outdated text is dropped
+        assert ['some other text'] == list(cache.texts.values())
+        assert len('some other text') == cache.size
+
+    def test_TextCache_evicts_after_inserting(self):
+        test_dir = get_temp_dir()
+        loc1 = self.create_file(os.path.join(test_dir, 'a.LICENSE'), 'a' * 10)
+        loc2 = self.create_file(os.path.join(test_dir, 'b.LICENSE'), 'b' * 10)
+        cache = util.TextCache(max_size=15)
+        cache.get(loc1)
+        cache.get(loc2)
+        assert 10 == cache.size
+        assert ['b' * 10] == list(cache.texts.values())
+
+
+class TestZipIndex(unittest.TestCase):
+
+    def get_test_zip(self):
+        import zipfile
+        location = get_temp_file('test.zip')
+        with zipfile.ZipFile(location, 'w') as zf:
+            zf.writestr('dir/', b'')
+            zf.writestr('dir/sub/file.txt', b'some\r\ntext')
+            zf.writestr('other.txt', b'other')
+            zf.writestr('../outside.txt', b'outside')
+        return location
+
+    def test_ZipIndex_exists_isdir_and_walk(self):
+        zip_index = util.ZipIndex(self.get_test_zip())
+        root = zip_index.root
+        assert zip_index.isdir(root)
+        assert zip_index.isdir(root + '/dir')
+        assert zip_index.isdir(root + '/dir/sub')
+        assert not zip_index.isdir(root + '/other.txt')
+        assert zip_index.exists(root + '/other.txt')
+        assert not zip_index.exists(root + '/dir/other.txt')
+        assert not zip_index.exists(posixpath.join(posixpath.dirname(root), 'outside.txt'))
+
+        expected = [
+            (root, ['dir'], ['other.txt']),
+            (root + '/dir', ['sub'], []),
+            (root + '/dir/sub', [], ['file.txt']),
+        ]
+        assert expected == list(zip_index.walk(root))
+        expected = [root + '/other.txt', root + '/dir/sub/file.txt']
+        assert expected == list(util.get_locations(root, path_index=zip_index))
+        zip_index.close()
+
+    def test_ZipIndex_read_text_and_extract(self):
+        zip_index = util.ZipIndex(self.get_test_zip())
+        location = zip_index.root + '/dir/sub/file.txt'
+        assert 'some\ntext' == zip_index.read_text(location)
+
+        target = get_temp_file()
+        zip_index.extract(location, target)
+        with io.open(target, 'rb') as tf:
+            assert b'some\r\ntext' == tf.read()
+        zip_index.close()
+
+
+class TestZipCopier(unittest.TestCase):
+
+    @unittest.skipIf(sys.version_info < (3, 7), 'no compression level before Python 3.7')
+    def test_set_compression_level_is_used_by_ZipFile_open(self):
+        import zipfile
+        data = ''.join('line %d of %d\n' % (i, i * 7919 % 1000) for i in range(20000))
+        data = data.encode('utf-8')
+        sizes = []
+        for level in (1, 9):
+            location = get_temp_file('test.zip')
+            with zipfile.ZipFile(location, 'w', zipfile.ZIP_DEFLATED) as zf:
+                info = zipfile.ZipInfo('data.txt')
+                info.compress_type = zipfile.ZIP_DEFLATED
+                util.set_compression_level(info, level)
+                with zf.open(info, 'w') as out:
+                    out.write(data)
+            with zipfile.ZipFile(location) as zf:
+                assert data == zf.read('data.txt')
+                sizes.append(zf.getinfo('data.txt').compress_size)
+        assert sizes[0] > sizes[1]
+
+
+class TestPathTrie(unittest.TestCase):
+
+    def test_PathTrie_has_ancestor(self):
+        trie = util.PathTrie()
+        trie.add('/a/b')
+        trie.add('c')
+        assert trie.has_ancestor('/a/b')
+        assert trie.has_ancestor('a/b/d/e.c')
+        assert trie.has_ancestor('c/d')
+        assert not trie.has_ancestor('/a')
+        assert not trie.has_ancestor('/a/bc')
+        assert not trie.has_ancestor('/cd')
+        assert not trie.has_ancestor('/a/b', strict=True)
+        assert trie.has_ancestor('/a/b/d', strict=True)
+
+    def test_PathTrie_has_ancestor_with_the_root(self):
+        trie = util.PathTrie()
+        trie.add('/')
+        assert trie.has_ancestor('/a/b')
+        assert trie.has_ancestor('a', strict=True)
+        assert trie.has_ancestor('/')
+        assert not trie.has_ancestor('/', strict=True)
+
+
+class TestPathIndex(unittest.TestCase):
+
+    def test_PathIndex_exists_and_isdir(self):
+        test_dir = get_temp_dir()
+        os.mkdir(os.path.join(test_dir, 'dir'))
+        with io.open(os.path.join(test_dir, 'dir', 'file'), 'w') as tf:
+            tf.write(u'text')
+        index = util.PathIndex()
+        assert index.exists(os.path.join(test_dir, 'dir'))
+        assert index.exists(os.path.join(test_dir, 'dir', 'file'))
+        assert not index.exists(os.path.join(test_dir, 'dir', 'other'))
+        assert not index.exists(os.path.join(test_dir, 'missing', 'file'))
+        assert index.isdir(os.path.join(test_dir, 'dir'))
+        assert not index.isdir(os.path.join(test_dir, 'dir', 'file'))
+        assert index.exists(test_dir + '/')
+
+    def test_PathIndex_lists_each_directory_once(self):
+        test_dir = get_temp_dir()
+        for name in ('a', 'b', 'c'):
+            with io.open(os.path.join(test_dir, name), 'w') as tf:
+                tf.write(u'text')
+        index = util.PathIndex()
+        for name in ('a', 'b', 'c'):
+            assert index.exists(os.path.join(test_dir, name))
+        assert [test_dir] == list(index.listings)
+
+
 class TestMiscUtils(unittest.TestCase):
 
+    def test_prepare_about_text_wraps_booleans_and_replaces_tabs(self):
+        test = (
+            'name: test\n'
+            'redistribute: yes\n'
+            'attribute:\tno\n'
+            'notes: some\tnotes')
+        expected = (
+            'name: test\n'
+            'redistribute: "yes"\n'
+            'attribute: "no"\n'
+            'notes: some    notes\n')
+        assert expected == util.prepare_about_text(test)
+        assert expected == util.replace_tab_with_spaces(util.wrap_boolean_value(test))
+
     def test_load_yaml_about_file_with_no_dupe(self):
         test = '''
 name: test
@@ -585,6 +800,29 @@ description: sample
         results = util.unique(items)
         assert expected == results
 
+    def test_unique_deduplicates_errors_and_keeps_ordering(self):
+        errors = [
+            Error(CRITICAL, 'msg1'),
+            Error(INFO, 'msg2'),
+            Error(CRITICAL, u'msg1'),
+            Error(INFO, 'msg1'),
+            Error(INFO, 'msg2'),
+        ]
+        expected = [
+            Error(CRITICAL, 'msg1'),
+            Error(INFO, 'msg2'),
+            Error(INFO, 'msg1'),
+        ]
+        assert expected == util.unique(errors)
+
+    def test_unique_handles_unhashable_items(self):
+        items = [[1], 'a', [1], 'a', [2]]
+        assert [[1], 'a', [2]] == util.unique(items)
+
+    def test_unique_handles_hashable_types_with_unhashable_items(self):
+        items = [(1, [2]), (1,), (1, [2]), (1,), (1, [3])]
+        assert [(1, [2]), (1,), (1, [3])] == util.unique(items)
+
     def test_unique_can_handle_About_object(self):
         base_dir = 'some_dir'
         test = {
@@ -662,3 +900,33 @@ description: sample
         assert len(licenses) == len(files_list)
         for license in licenses:
             assert license in files_list
+
+    def test_FileCopier_copy_in_parallel_and_skip_unchanged_files(self):
+        des = get_temp_dir()
+        test_dir = get_test_loc('test_util/licenses/')
+        copier = util.FileCopier(workers=4)
+        assert [] == copier.copy([(test_dir, des)])
+        assert 3 == copier.counts[copier.COPIED]
+        for name in ('mit.LICENSE', 'mit2.LICENSE', 'public-domain.LICENSE'):
+            copied = os.path.join(des, 'licenses', name)
+            with io.open(copied, 'rb') as cf, io.open(os.path.join(test_dir, name), 'rb') as tf:
+                assert tf.read() == cf.read()
+
+        copier = util.FileCopier(workers=4)
+        errors = copier.copy([(test_dir, des)])
+        assert [WARNING] == [e.severity for e in errors]
+        assert 0 == copier.counts[copier.COPIED]
+        assert 3 == copier.counts[copier.SKIPPED]
+        assert 'unchanged files were skipped' in copier.get_summary()
+
+    def test_FileCopier_hardlink(self):
+        src = get_temp_dir()
+        test_file = os.path.join(src, 'a.c')
+        with io.open(test_file, 'w') as tf:
+            tf.write(u'some code')
+        des = get_temp_dir()
+        copier = util.FileCopier(link=True)
+        assert [] == copier.copy([(test_file, des)])
+        assert 1 == copier.counts[copier.LINKED] + copier.counts[copier.COPIED]
+        if copier.counts[copier.LINKED]:
+            assert os.path.samefile(test_file, os.path.join(des, 'a.c'))
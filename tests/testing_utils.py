@@ -77,6 +77,11 @@ def build_temp_dir(prefix='test-attributecode-'):
     return location
 
 
+# never write the compiled templates of the tests in the user cache directory
+os.environ.setdefault('ABOUTCODE_TEMPLATE_CACHE',
+                      build_temp_dir('test-attributecode-templates-'))
+
+
 def get_temp_file(file_name='test-attributecode-tempfile'):
     """
     Return a unique new temporary file location to a non-existing